@@ -1,26 +1,63 @@
-
 from fastapi import Request, HTTPException, Depends
-from typing import Optional
+from typing import Optional, Any
 from database.repositories import SessionRepository
+import json
 import secrets
 
+USER_ID_HEADER = "X-User-Id"
+USER_ID_COOKIE = "user_id"
+
+# json_body ещё не разобран; JSON null — обычное значение тела и кэшируется как None
+_UNSET = object()
+_FORM_CONTENT_TYPES = ("multipart/", "application/x-www-form-urlencoded")
+
+
 def get_client_ip(request: Request) -> str:
     return request.client.host
 
+
+async def get_request_json(request: Request) -> Optional[Any]:
+    """Тело запроса как JSON, разобранное не больше одного раза за запрос.
+
+    Результат (в том числе неудачный разбор) сохраняется в request.state,
+    поэтому зависимости и обработчики могут вызывать функцию повторно.
+    """
+    cached = getattr(request.state, "json_body", _UNSET)
+    if cached is _UNSET:
+        cached = None
+        content_type = request.headers.get("content-type", "")
+        if request.method not in ("GET", "HEAD") and not content_type.startswith(_FORM_CONTENT_TYPES):
+            body = await request.body()
+            if body:
+                try:
+                    cached = json.loads(body)
+                except ValueError:
+                    pass
+        request.state.json_body = cached
+
+    return cached
+
+
+async def get_request_user_id(request: Request) -> Optional[str]:
+    user_id = (
+        request.query_params.get('user_id')
+        or request.headers.get(USER_ID_HEADER)
+        or request.cookies.get(USER_ID_COOKIE)
+    )
+    if user_id:
+        return user_id
+
+    body = await get_request_json(request)
+    if isinstance(body, dict):
+        return body.get('user_id')
+    return None
+
+
 async def get_current_user(request: Request) -> int:
     ip_address = get_client_ip(request)
-    
-    
-    user_id = request.query_params.get('user_id')
-    
-    
-    if not user_id:
-        try:
-            body = await request.json()
-            user_id = body.get('user_id')
-        except:
-            pass
-    
+
+    user_id = await get_request_user_id(request)
+
     if not user_id:
         raise HTTPException(status_code=403, detail="User ID required")
     
@@ -36,4 +73,4 @@ async def get_current_user(request: Request) -> int:
 
 
 def generate_oauth_state() -> str:
-    return secrets.token_urlsafe(32)
\ No newline at end of file
+    return secrets.token_urlsafe(32)
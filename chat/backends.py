@@ -0,0 +1,133 @@
+"""Бэкенды LLM для CareerGuideBot.
+
+GeminiBackend ходит в Google Gemini, FakeBackend работает локально без сети
+и имитирует задержку, скорость генерации и ошибки — для нагрузочных тестов чата.
+"""
+import asyncio
+import hashlib
+import random
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional
+from config import (
+    GEMINI_API_KEY, FAKE_LLM_LATENCY, FAKE_LLM_TOKENS_PER_SEC,
+    FAKE_LLM_FAILURE_RATE, FAKE_LLM_RESPONSE_TOKENS, FAKE_LLM_SEED,
+)
+
+
+class LLMBackend(ABC):
+    """Интерфейс бэкенда: полный ответ или поток кусков текста"""
+
+    name = "base"
+
+    @abstractmethod
+    async def generate(self, prompt: str) -> str:
+        """Полный ответ модели"""
+
+    @abstractmethod
+    def stream(self, prompt: str) -> AsyncIterator[str]:
+        """Асинхронный генератор кусков ответа"""
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str], model_name: str = "gemini-2.0-flash"):
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY не задан")
+
+        import google.generativeai as genai
+
+        # без сетевых запросов: ключ и модель проверяются при первом обращении
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+        print("Гемини подключен успешно")
+
+    async def generate(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class FakeBackendError(RuntimeError):
+    pass
+
+
+class FakeBackend(LLMBackend):
+    """Локальная замена LLM.
+
+    Ответ зависит только от промпта, поэтому повторяемый. Сначала ждёт latency
+    секунд (время до первого токена), потом отдаёт tokens_per_second слов в секунду.
+    С вероятностью failure_rate запрос падает: до первого токена или посреди ответа.
+    """
+
+    name = "fake"
+
+    _WORDS = (
+        "профессия", "навыки", "обучение", "карьера", "опыт", "интересы",
+        "университет", "практика", "стажировка", "направление", "развитие", "цель",
+    )
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        tokens_per_second: float = 40,
+        failure_rate: float = 0.0,
+        response_tokens: int = 120,
+        seed: Optional[int] = None,
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.failure_rate = failure_rate
+        self.response_tokens = response_tokens
+        self._random = random.Random(seed)
+
+    def _tokens(self, prompt: str) -> list:
+        digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+        words = self._WORDS
+        return [
+            words[digest[i % len(digest)] % len(words)] + ("." if i % 12 == 11 else "")
+            for i in range(self.response_tokens)
+        ]
+
+    def _failure_point(self, n_tokens: int) -> Optional[int]:
+        """Номер токена, на котором запрос упадёт, или None"""
+        if self._random.random() >= self.failure_rate:
+            return None
+        return self._random.randint(0, n_tokens)
+
+    async def generate(self, prompt: str) -> str:
+        return "".join([token async for token in self.stream(prompt)]).strip()
+
+    async def stream(self, prompt: str) -> AsyncIterator[str]:
+        tokens = self._tokens(prompt)
+        fail_at = self._failure_point(len(tokens))
+        delay = 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+
+        await asyncio.sleep(self.latency)
+        for i, token in enumerate(tokens):
+            if i == fail_at:
+                raise FakeBackendError(f"fake backend failure at token {i}")
+            if i:
+                await asyncio.sleep(delay)
+            yield token + " "
+        if fail_at == len(tokens):
+            raise FakeBackendError("fake backend failure at end of stream")
+
+
+def create_backend(name: str) -> LLMBackend:
+    if name == "gemini":
+        return GeminiBackend(GEMINI_API_KEY)
+    if name == "fake":
+        return FakeBackend(
+            latency=FAKE_LLM_LATENCY,
+            tokens_per_second=FAKE_LLM_TOKENS_PER_SEC,
+            failure_rate=FAKE_LLM_FAILURE_RATE,
+            response_tokens=FAKE_LLM_RESPONSE_TOKENS,
+            seed=FAKE_LLM_SEED,
+        )
+    raise ValueError(f"Unknown LLM backend: {name}")
@@ -1,34 +1,102 @@
-import google.generativeai as genai
+import asyncio
+import hashlib
+import re
+import threading
+import time
+from typing import Optional
+from cache import TTLCache
+from chat.backends import LLMBackend, create_backend
+from chat.context import build_context
+from chat.history import message_history
 from database.repositories import ChatRepository
-from config import GEMINI_API_KEY
+from config import (
+    LLM_BACKEND, LLM_TIMEOUT, LLM_MAX_CONCURRENCY, LLM_INIT_TIMEOUT,
+    CHAT_RESPONSE_CACHE_SIZE, CHAT_RESPONSE_CACHE_TTL,
+    CHAT_RESPONSE_CACHE_MAX_MESSAGES, CHAT_RESPONSE_CACHE_MAX_CHARS,
+)
+
+# ответы на типовые первые вопросы ("помоги выбрать профессию") общие для всех пользователей
+response_cache = TTLCache(max(CHAT_RESPONSE_CACHE_SIZE, 1), CHAT_RESPONSE_CACHE_TTL)
 
 class CareerGuideBot:
-    def __init__(self):
+    def __init__(self, backend: Optional[LLMBackend] = None):
+        # клиент LLM создаётся в фоне (start), чтобы импорт и старт приложения не ждали сеть
+        self.backend = backend
+        self.state = "ready" if backend is not None else "pending"
+        self._init_error = None
+        self._init_ms = None
+        self._cache_bypassed = 0
+        self._ready = threading.Event()
+        self._init_lock = threading.Lock()
+        if backend is not None:
+            self._ready.set()
+
+        # ограничивает число одновременных запросов к LLM
+        self._llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+
+    def start(self):
+        """Запускает фоновую инициализацию клиента LLM, повторный вызов ничего не делает"""
+        with self._init_lock:
+            if self.state != "pending":
+                return
+            self.state = "initializing"
+        threading.Thread(target=self._init_backend, name="llm-init", daemon=True).start()
+
+    def _init_backend(self):
+        started = time.perf_counter()
         try:
-            genai.configure(api_key=GEMINI_API_KEY)
-        
-        
-            models = genai.list_models()
-            print("Доступные модели:")
-            for model in models:
-                print(f" - {model.name}")
-        
-        
-            self.model = genai.GenerativeModel('gemini-2.0-flash')
-            print("Гемини подключен успешно")
-        
+            self.backend = create_backend(LLM_BACKEND)
+            self.state = "ready"
+            print(f"LLM backend: {self.backend.name}")
+
         except Exception as e:
             print(f"Ошибка при подключении: {e}")
             print("Начнется использование заглушек")
-            self.model = None
+            self.backend = None
+            self._init_error = str(e)
+            self.state = "unavailable"
+
+        finally:
+            self._init_ms = round((time.perf_counter() - started) * 1000, 1)
+            self._ready.set()
+
+    async def _get_backend(self) -> Optional[LLMBackend]:
+        """Бэкенд LLM или None, если он недоступен. Ждёт только пока идёт инициализация"""
+        if not self._ready.is_set():
+            self.start()
+            ready = await asyncio.to_thread(self._ready.wait, LLM_INIT_TIMEOUT)
+            if not ready:
+                print(f"LLM backend is not ready after {LLM_INIT_TIMEOUT}s, using mock")
+        return self.backend
+
+    def get_status(self) -> dict:
+        return {
+            "state": self.state,
+            "backend": self.backend.name if self.backend is not None else None,
+            "init_ms": self._init_ms,
+            "error": self._init_error,
+            "response_cache": self.get_cache_stats(),
+            "message_history": message_history.get_stats(),
+        }
+
+    def get_cache_stats(self) -> dict:
+        stats = response_cache.stats()
+        stats["enabled"] = CHAT_RESPONSE_CACHE_SIZE > 0
+        with response_cache._lock:
+            stats["bypassed"] = self._cache_bypassed
+        return stats
+
+    def set_response_cache(self, user_id: int, chat_id: int, enabled: bool) -> bool:
+        return ChatRepository.set_response_cache(user_id, chat_id, enabled)
 
     def create_chat(self, user_id: int, title: str = "Новый чат") -> int:
         chat_id = ChatRepository.create_chat(user_id, title)
+        message_history.created(chat_id)
         ChatRepository.set_active_chat(user_id, chat_id)
         return chat_id
             
-    def get_chats(self, user_id: int):
-        return ChatRepository.get_user_chats(user_id)
+    def get_chats(self, user_id: int, after: Optional[list] = None, limit: int = -1):
+        return ChatRepository.get_user_chats(user_id, after, limit)
             
     def set_active_chat(self, user_id: int, chat_id: int) -> bool:
         return ChatRepository.set_active_chat(user_id, chat_id)
@@ -37,66 +105,191 @@ class CareerGuideBot:
         return ChatRepository.get_active_chat(user_id)
             
     def delete_chat(self, user_id: int, chat_id: int) -> bool:
-        return ChatRepository.delete_chat(user_id, chat_id)
+        deleted = ChatRepository.delete_chat(user_id, chat_id)
+        if deleted:
+            message_history.invalidate(chat_id)
+        return deleted
             
     def add_message(self, chat_id: int, role: str, content: str):
-        ChatRepository.add_message(chat_id, role, content)
+        message = ChatRepository.add_message(chat_id, role, content)
+        message_history.append(chat_id, message)
         
     def get_messages(self, chat_id: int):
-        return ChatRepository.get_messages(chat_id)
+        return message_history.all(chat_id)
+
+    def get_messages_page(self, chat_id: int, before_id: Optional[int], limit: int):
+        return message_history.page(chat_id, before_id, limit)
         
-    def get_response(self, user_id: int, message: str) -> str:
+    async def get_response(self, user_id: int, message: str) -> str:
         print(f"Getting response for user {user_id}, message: {message}")
     
-        if self.model is None:
+        backend = await self._get_backend()
+        if backend is None:
             print("Using mock response")
             mock_response = self._get_smart_mock_response(message)
             print(f"Mock response: {mock_response}")
             return mock_response
         
+        chat_id = None
         try:
-            active_chat = self.get_active_chat(user_id)
-            if not active_chat:
-                chat_id = self.create_chat(user_id, message[:30] + "..." if len(message) > 30 else message)
-                active_chat = self.get_active_chat(user_id)
+            # работа с базой синхронная — уводим её из event loop
+            chat_id, prompt, cache_key = await asyncio.to_thread(self._prepare_turn, user_id, message)
+
+            response_text = response_cache.get(cache_key) if cache_key else None
+            if response_text is not None:
+                print("Response cache hit")
             else:
-                chat_id = active_chat["id"]
-            
-            print(f"Active chat ID: {chat_id}")
-        
-        
-            self.add_message(chat_id, "user", message)
-            print("User message saved to database")
-        
-        
-            messages = self.get_messages(chat_id)
-            print(f"Messages history: {len(messages)} messages")
-        
-            prompt = self._build_prompt_with_history(messages)
-            response = self.model.generate_content(prompt)
-        
-            response_text = response.text.strip()
-            print(f"Generated Gemini response: '{response_text}'")
+                response_text = await self._generate(backend, prompt)
+                print(f"Generated LLM response: '{response_text}'")
+                if response_text and cache_key:
+                    response_cache.set(cache_key, response_text)
         
         
             if not response_text:
-                print("Gemini returned empty response, using mock")
+                print("LLM returned empty response, using mock")
                 response_text = self._get_smart_mock_response(message)
             
         
             print(f"Saving assistant response to database: '{response_text[:50]}...'")
-            self.add_message(chat_id, "assistant", response_text)
+            await asyncio.to_thread(self.add_message, chat_id, "assistant", response_text)
         
             return response_text
         
+        except asyncio.TimeoutError:
+            print(f"LLM did not answer in {LLM_TIMEOUT}s, using mock")
+            mock_response = self._get_smart_mock_response(message)
+            await self._save_fallback(chat_id, mock_response)
+            return mock_response
+
         except Exception as e:
             print(f"Error in get_response: {e}")
             error_response = self._get_smart_mock_response(message)
             print(f"Returning error response: {error_response}")
+            await self._save_fallback(chat_id, error_response)
             return error_response
+
+    async def _save_fallback(self, chat_id: Optional[int], response_text: str):
+        """Сохраняет заглушку вместо ответа LLM: без неё после перезагрузки у вопроса
+        не будет ответа, а следующий промпт не увидит этот ход диалога"""
+        if chat_id is None:
+            return
+        try:
+            await asyncio.to_thread(self.add_message, chat_id, "assistant", response_text)
+        except Exception as e:
+            print(f"Failed to save fallback response: {e}")
+
+    async def stream_response(self, user_id: int, message: str):
+        """Отдаёт ответ по мере генерации парами (event, text).
+        event "delta" — очередной кусок текста, "replace" — показанный текст
+        нужно заменить целиком (заглушка после ошибки посреди ответа)."""
+        print(f"Streaming response for user {user_id}, message: {message}")
+
+        backend = await self._get_backend()
+        if backend is None:
+            print("Using mock response")
+            yield "delta", self._get_smart_mock_response(message)
+            return
+
+        chat_id = None
+        parts = []
+        try:
+            chat_id, prompt, cache_key = await asyncio.to_thread(self._prepare_turn, user_id, message)
+
+            cached = response_cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                print("Response cache hit")
+                yield "delta", cached
+                await asyncio.to_thread(self.add_message, chat_id, "assistant", cached)
+                return
+
+            await asyncio.wait_for(self._llm_semaphore.acquire(), timeout=LLM_TIMEOUT)
+            chunks = backend.stream(prompt)
+            try:
+                while True:
+                    # таймаут на каждый кусок: длинный ответ может идти дольше LLM_TIMEOUT
+                    try:
+                        chunk = await asyncio.wait_for(chunks.__anext__(), timeout=LLM_TIMEOUT)
+                    except StopAsyncIteration:
+                        break
+                    parts.append(chunk)
+                    yield "delta", chunk
+            finally:
+                self._llm_semaphore.release()
+                await chunks.aclose()
+
+        except Exception as e:
+            print(f"Error in stream_response after {len(parts)} chunks: {e!r}")
+            response_text = self._get_smart_mock_response(message)
+            # сохраняем до отправки: клиент может отключиться сразу после неё
+            await self._save_fallback(chat_id, response_text)
+            yield "replace", response_text
+            return
+
+        response_text = "".join(parts).strip()
+        if not response_text:
+            print("LLM returned empty response, using mock")
+            response_text = self._get_smart_mock_response(message)
+            yield "replace", response_text
+        elif cache_key:
+            response_cache.set(cache_key, response_text)
+
+        print(f"Saving assistant response to database: '{response_text[:50]}...'")
+        await asyncio.to_thread(self.add_message, chat_id, "assistant", response_text)
+
+    def _prepare_turn(self, user_id: int, message: str):
+        """Сохраняет сообщение пользователя и собирает промпт.
+        Возвращает (chat_id, prompt, cache_key); cache_key None, если ответ не кэшируется"""
+        active_chat = self.get_active_chat(user_id)
+        if not active_chat:
+            chat_id = self.create_chat(user_id, message[:30] + "..." if len(message) > 30 else message)
+            cache_enabled = True
+        else:
+            chat_id = active_chat["id"]
+            cache_enabled = active_chat["response_cache"]
+
+        print(f"Active chat ID: {chat_id}")
+
+
+        self.add_message(chat_id, "user", message)
+        print("User message saved to database")
+
+
+        summary, messages = build_context(chat_id)
+        print(f"Messages history: {len(messages)} messages, summary: {bool(summary)}")
+
+        prompt = self._build_prompt_with_history(messages, summary)
+        # со сводкой диалог уже не первый — такой ответ общим не будет
+        cache_key = self._response_cache_key(messages, prompt) if cache_enabled and not summary else None
+        if cache_key is None:
+            # вызывается из потоков asyncio.to_thread — счётчик под блокировкой кэша, как его hits/misses
+            with response_cache._lock:
+                self._cache_bypassed += 1
+        return chat_id, prompt, cache_key
+
+    @staticmethod
+    def _response_cache_key(messages: list, prompt: str) -> Optional[str]:
+        """Ключ кэша для короткого диалога в начале чата, иначе None.
+        Регистр, пунктуация и лишние пробелы на ключ не влияют"""
+        if CHAT_RESPONSE_CACHE_SIZE <= 0 or len(messages) > CHAT_RESPONSE_CACHE_MAX_MESSAGES:
+            return None
+        if any(len(msg["content"]) > CHAT_RESPONSE_CACHE_MAX_CHARS for msg in messages):
+            return None
+        normalized = " ".join(re.findall(r"\w+", prompt.lower()))
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    async def _generate(self, backend: LLMBackend, prompt: str) -> str:
+        """Запрос к LLM без блокировки event loop, с лимитом параллельности и таймаутом"""
+        async def call():
+            async with self._llm_semaphore:
+                response_text = await backend.generate(prompt)
+                return response_text.strip()
+
+        # таймаут включает ожидание в очереди: пользователь не должен ждать дольше
+        return await asyncio.wait_for(call(), timeout=LLM_TIMEOUT)
         
-    def _build_prompt_with_history(self, messages: list) -> str:
-        """Строит промпт с историей диалога в формате, понятном для Gemini"""
+    def _build_prompt_with_history(self, messages: list, summary: Optional[str] = None) -> str:
+        """Строит промпт с историей диалога в формате, понятном для Gemini.
+        messages — уже отобранный по бюджету хвост чата, summary — сводка более ранних сообщений"""
         
         system_prompt = """Ты — "Профорентолог" — умный ИИ-помощник, который помогает подросткам и студентам найти подходящую профессию, понять свои интересы и выбрать образовательный путь.
 
@@ -148,7 +341,9 @@ class CareerGuideBot:
 
         
         conversation_history = ""
-        for msg in messages[-6:]:  
+        if summary:
+            conversation_history += f"\nКратко о предыдущей части диалога:\n{summary}\n"
+        for msg in messages:
             if msg["role"] == "user":
                 conversation_history += f"\nПользователь: {msg['content']}"
             else:
@@ -0,0 +1,72 @@
+"""Контекст диалога для промпта бота.
+
+В промпт попадает хвост чата в пределах бюджета токенов. Вытесненные из него
+сообщения сворачиваются в короткую сводку (таблица chat_summaries), которая
+дополняется по мере роста чата. Поэтому ни чтение из базы, ни размер промпта
+не растут вместе с длиной переписки.
+"""
+import re
+from typing import List, Optional, Tuple
+from chat.history import message_history
+from database.repositories import ChatRepository
+from config import CHAT_CONTEXT_TOKENS, CHAT_CONTEXT_MAX_MESSAGES, CHAT_SUMMARY_TOKENS
+
+# грубая оценка для смешанного русского и английского текста
+CHARS_PER_TOKEN = 3
+SUMMARY_LINE_CHARS = 160
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _summary_line(message: dict) -> str:
+    """Первое предложение сообщения без HTML-разметки"""
+    text = " ".join(re.sub(r"<[^>]+>", " ", message["content"]).split())
+    sentence = re.split(r"(?<=[.!?])\s", text, maxsplit=1)[0]
+    if len(sentence) > SUMMARY_LINE_CHARS:
+        sentence = sentence[:SUMMARY_LINE_CHARS].rstrip() + "…"
+    speaker = "Пользователь" if message["role"] == "user" else "Консультант"
+    return f"- {speaker}: {sentence}"
+
+
+def extend_summary(summary: Optional[str], messages: List[dict]) -> str:
+    lines = summary.splitlines() if summary else []
+    lines.extend(_summary_line(message) for message in messages)
+    # самые старые пункты выпадают, чтобы сводка укладывалась в свой бюджет
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > CHAT_SUMMARY_TOKENS:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def build_context(chat_id: int) -> Tuple[Optional[str], List[dict]]:
+    """Возвращает (сводка более ранней части диалога или None, последние сообщения)"""
+    stored = message_history.get_summary(chat_id)
+    summary = stored["summary"] if stored else None
+    summarized_until = stored["last_message_id"] if stored else 0
+
+    recent = message_history.recent(chat_id, CHAT_CONTEXT_MAX_MESSAGES, after_id=summarized_until)
+
+    window = []
+    used = 0
+    for message in reversed(recent):
+        cost = estimate_tokens(message["content"])
+        # последнее сообщение (текущий вопрос) берём всегда
+        if window and used + cost > CHAT_CONTEXT_TOKENS:
+            break
+        window.append(message)
+        used += cost
+    window.reverse()
+
+    dropped = recent[:len(recent) - len(window)]
+    if len(recent) == CHAT_CONTEXT_MAX_MESSAGES:
+        # выборка упёрлась в лимит: до неё могут быть ещё не свёрнутые сообщения
+        dropped = ChatRepository.get_messages_between(
+            chat_id, summarized_until, recent[0]["id"], CHAT_CONTEXT_MAX_MESSAGES
+        ) + dropped
+
+    if dropped:
+        summary = extend_summary(summary, dropped)
+        message_history.save_summary(chat_id, summary, dropped[-1]["id"])
+
+    return summary, window
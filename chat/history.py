@@ -0,0 +1,211 @@
+"""Кэш последних сообщений чатов в памяти.
+
+Для каждого чата хранится кольцевой буфер последних CHAT_HISTORY_MESSAGES
+сообщений. Новые сообщения дописываются в буфер сразу после записи в базу,
+удаление чата сбрасывает буфер. Число чатов в памяти ограничено, давно не
+использованные вытесняются по LRU.
+
+Буфер локален для процесса, поэтому с несколькими воркерами он не чаще раза
+в CHAT_HISTORY_REVALIDATE секунд сверяется с MAX(id) сообщений чата в базе:
+сообщение, записанное другим воркером, или удаление чата там сбрасывают буфер.
+"""
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+from cache import TTLCache
+from database.repositories import ChatRepository
+from config import CHAT_HISTORY_CHATS, CHAT_HISTORY_MESSAGES, CHAT_HISTORY_REVALIDATE
+
+
+_NOT_LOADED = object()
+
+
+class _ChatBuffer:
+    __slots__ = ("messages", "complete", "summary", "checked_at")
+
+    def __init__(self, messages: list, complete: bool, summary=_NOT_LOADED):
+        self.messages = deque(messages, maxlen=CHAT_HISTORY_MESSAGES)
+        # True — в буфере вся история чата, иначе только её хвост
+        self.complete = complete
+        # сводка ранней части диалога из chat_summaries (см. chat.context)
+        self.summary = summary
+        # когда буфер последний раз совпал с базой
+        self.checked_at = time.monotonic()
+
+    def last_id(self) -> int:
+        return self.messages[-1]["id"] if self.messages else 0
+
+
+class _Loading:
+    """Идущая загрузка чата из базы и изменения, случившиеся за время SELECT"""
+    __slots__ = ("readers", "appended", "dropped")
+
+    def __init__(self):
+        self.readers = 0
+        self.appended: List[dict] = []
+        self.dropped = False
+
+
+class MessageHistory:
+    def __init__(self, max_chats: int, revalidate_interval: float = -1):
+        self._buffers = TTLCache(max_chats)
+        self.revalidate_interval = revalidate_interval
+        self._lock = threading.Lock()
+        # SELECT идёт без блокировки; сообщения, дописанные во время него, копятся здесь
+        self._loading: Dict[int, _Loading] = {}
+        self.db_reads = 0
+        self.revalidations = 0
+        self.stale = 0
+
+    def _count_read(self):
+        with self._lock:
+            self.db_reads += 1
+
+    def _is_fresh(self, buffer: _ChatBuffer) -> bool:
+        if self.revalidate_interval < 0:
+            return True
+        return time.monotonic() - buffer.checked_at < self.revalidate_interval
+
+    def _load(self, chat_id: int) -> _ChatBuffer:
+        buffer = self._buffers.get(chat_id)
+        if buffer is not None:
+            if self._is_fresh(buffer):
+                return buffer
+            last_id = ChatRepository.get_last_message_id(chat_id)
+            with self._lock:
+                self.revalidations += 1
+                if buffer.last_id() == last_id:
+                    buffer.checked_at = time.monotonic()
+                    return buffer
+                # чат изменён в обход этого процесса
+                self.stale += 1
+                if self._buffers.peek(chat_id) is buffer:
+                    self._buffers.delete(chat_id)
+
+        with self._lock:
+            buffer = self._buffers.peek(chat_id)
+            if buffer is not None:
+                return buffer
+            self.db_reads += 1
+            loading = self._loading.setdefault(chat_id, _Loading())
+            loading.readers += 1
+        try:
+            messages = ChatRepository.get_recent_messages(chat_id, CHAT_HISTORY_MESSAGES + 1)
+        finally:
+            with self._lock:
+                loading.readers -= 1
+                if not loading.readers:
+                    self._loading.pop(chat_id, None)
+
+        complete = len(messages) <= CHAT_HISTORY_MESSAGES
+        with self._lock:
+            buffer = self._buffers.peek(chat_id)
+            if buffer is not None:
+                return buffer
+            known = {message["id"] for message in messages}
+            appended = [message for message in loading.appended if message["id"] not in known]
+            if appended:
+                messages = sorted(messages + appended, key=lambda message: message["id"])
+                complete = complete and len(messages) <= CHAT_HISTORY_MESSAGES
+            buffer = _ChatBuffer(messages[-CHAT_HISTORY_MESSAGES:], complete)
+            # чат удалён во время загрузки: буфер отдаётся, но не кэшируется
+            if not loading.dropped:
+                self._buffers.set(chat_id, buffer)
+            return buffer
+
+    def created(self, chat_id: int):
+        """Новый чат пуст — его история известна без запроса к базе"""
+        self._buffers.set(chat_id, _ChatBuffer([], True, summary=None))
+
+    def append(self, chat_id: int, message: dict):
+        with self._lock:
+            buffer = self._buffers.peek(chat_id)
+            if buffer is None:
+                loading = self._loading.get(chat_id)
+                if loading is not None:
+                    loading.appended.append(message)
+                return
+            # сообщение могло уже попасть в буфер при загрузке из базы
+            if any(cached["id"] == message["id"] for cached in buffer.messages):
+                return
+            if len(buffer.messages) == buffer.messages.maxlen:
+                buffer.complete = False
+            out_of_order = buffer.messages and buffer.messages[-1]["id"] > message["id"]
+            buffer.messages.append(message)
+            if out_of_order:
+                buffer.messages = deque(
+                    sorted(buffer.messages, key=lambda cached: cached["id"]),
+                    maxlen=CHAT_HISTORY_MESSAGES,
+                )
+
+    def invalidate(self, chat_id: int):
+        with self._lock:
+            self._buffers.delete(chat_id)
+            loading = self._loading.get(chat_id)
+            if loading is not None:
+                loading.dropped = True
+
+    def all(self, chat_id: int) -> List[dict]:
+        buffer = self._load(chat_id)
+        with self._lock:
+            if buffer.complete:
+                return list(buffer.messages)
+        self._count_read()
+        return ChatRepository.get_messages(chat_id)
+
+    def page(self, chat_id: int, before_id: Optional[int], limit: int) -> Tuple[List[dict], bool]:
+        """Страница истории для ленивой подгрузки: (сообщения по возрастанию id, есть ли более старые)"""
+        buffer = self._load(chat_id)
+        with self._lock:
+            messages = list(buffer.messages)
+            complete = buffer.complete
+        if before_id is not None:
+            messages = [message for message in messages if message["id"] < before_id]
+        if len(messages) > limit:
+            return messages[-limit:], True
+        if complete:
+            return messages, False
+        self._count_read()
+        # на одно сообщение больше, чтобы узнать, есть ли ещё страница
+        messages = ChatRepository.get_messages_page(chat_id, before_id, limit + 1)
+        return messages[-limit:], len(messages) > limit
+
+    def recent(self, chat_id: int, limit: int, after_id: int = 0) -> List[dict]:
+        """Последние limit сообщений с id > after_id, по возрастанию id"""
+        buffer = self._load(chat_id)
+        with self._lock:
+            messages = list(buffer.messages)
+            complete = buffer.complete
+        tail = [message for message in messages if message["id"] > after_id]
+        # буфер покрывает запрос, если в нём хватает сообщений или до его начала ничего не нужно
+        if len(tail) >= limit or complete or len(tail) < len(messages):
+            return tail[-limit:]
+        self._count_read()
+        return ChatRepository.get_recent_messages(chat_id, limit, after_id=after_id)
+
+    def get_summary(self, chat_id: int):
+        buffer = self._load(chat_id)
+        if buffer.summary is _NOT_LOADED:
+            self._count_read()
+            buffer.summary = ChatRepository.get_summary(chat_id)
+        return buffer.summary
+
+    def save_summary(self, chat_id: int, summary: str, last_message_id: int):
+        ChatRepository.save_summary(chat_id, summary, last_message_id)
+        buffer = self._buffers.peek(chat_id)
+        if buffer is not None:
+            buffer.summary = {"summary": summary, "last_message_id": last_message_id}
+
+    def get_stats(self) -> dict:
+        stats = self._buffers.stats()
+        stats["messages_per_chat"] = CHAT_HISTORY_MESSAGES
+        with self._lock:
+            stats["db_reads"] = self.db_reads
+            stats["revalidations"] = self.revalidations
+            stats["stale"] = self.stale
+        stats["revalidate_interval"] = self.revalidate_interval
+        return stats
+
+
+message_history = MessageHistory(CHAT_HISTORY_CHATS, CHAT_HISTORY_REVALIDATE)
@@ -4,4 +4,7 @@ class ChatMessage(BaseModel):
     message: str
 
 class CreateChatRequest(BaseModel):
-    title: str = "Новый чат"
\ No newline at end of file
+    title: str = "Новый чат"
+
+class ResponseCacheRequest(BaseModel):
+    enabled: bool
@@ -1,9 +1,13 @@
+import asyncio
+import json
+from typing import Optional
 from fastapi import APIRouter, Request, Depends, Query
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from chat.bot import CareerGuideBot
-from chat.models import ChatMessage, CreateChatRequest
-from config import TEMPLATES_DIR, STATIC_DIR
+from chat.models import ChatMessage, CreateChatRequest, ResponseCacheRequest
+from database.serialization import encode_cursor, decode_cursor
+from config import TEMPLATES_DIR, STATIC_DIR, LLM_DISCONNECT_POLL, CHAT_PAGE_SIZE, CHAT_PAGE_MAX
 from fastapi.staticfiles import StaticFiles
 
 router = APIRouter(prefix="/chat", tags=["chat"])
@@ -15,6 +19,24 @@ chat_bot = CareerGuideBot()
 async def get_user_id(user_id: int = Query(...)):
     return user_id
 
+
+async def run_until_disconnected(request: Request, coro):
+    """Выполняет корутину, отменяя её, если клиент закрыл соединение.
+    Возвращает None, если запрос был отменён."""
+    task = asyncio.create_task(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=LLM_DISCONNECT_POLL)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                print("Client disconnected, cancelling LLM request")
+                task.cancel()
+                return None
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
 @router.get('', response_class=HTMLResponse)
 def chat_bot_page(request: Request, user_id: int = Depends(get_user_id)):
     return templates.TemplateResponse("chat_bot.html", {
@@ -22,14 +44,32 @@ def chat_bot_page(request: Request, user_id: int = Depends(get_user_id)):
         "user_id": user_id
     })
 
+@router.get('/status')
+async def get_chat_status():
+    """Состояние клиента LLM: pending, initializing, ready или unavailable"""
+    return {"status": "success", "llm": chat_bot.get_status()}
+
 @router.get('/chats')
-async def get_user_chats(user_id: int = Depends(get_user_id)):
+async def get_user_chats(
+    user_id: int = Depends(get_user_id),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(CHAT_PAGE_SIZE, ge=1, le=CHAT_PAGE_MAX)
+):
+    """Список чатов страницами: следующая страница — с cursor=next_cursor"""
     try:
-        chats = chat_bot.get_chats(user_id)
+        after = decode_cursor(cursor) if cursor else None
+        chats = chat_bot.get_chats(user_id, after, limit + 1)
+        has_more = len(chats) > limit
+        chats = chats[:limit]
         active_chat = chat_bot.get_active_chat(user_id)
+        next_cursor = None
+        if has_more:
+            next_cursor = encode_cursor([chats[-1]["updated_at"], chats[-1]["id"]])
         return {
             "status": "success",
             "chats": chats,
+            "has_more": has_more,
+            "next_cursor": next_cursor,
             "active_chat": active_chat
         }
     except Exception as e:
@@ -64,6 +104,22 @@ async def set_active_chat(
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
+@router.post('/{chat_id}/response_cache')
+async def set_response_cache(
+    chat_id: int,
+    cache_request: ResponseCacheRequest,
+    user_id: int = Depends(get_user_id)
+):
+    """Включает или отключает общий кэш ответов бота для чата"""
+    try:
+        success = chat_bot.set_response_cache(user_id, chat_id, cache_request.enabled)
+        if success:
+            return {"status": "success", "response_cache": cache_request.enabled}
+        else:
+            return {"status": "error", "error": "Chat not found"}
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+
 @router.delete('/{chat_id}')
 async def delete_chat(
     chat_id: int,
@@ -80,16 +136,22 @@ async def delete_chat(
         return {"status": "error", "error": str(e)}
 
 @router.get('/messages')
-async def get_chat_messages(user_id: int = Depends(get_user_id)):
+async def get_chat_messages(
+    user_id: int = Depends(get_user_id),
+    before_id: Optional[int] = Query(None),
+    limit: int = Query(CHAT_PAGE_SIZE, ge=1, le=CHAT_PAGE_MAX)
+):
+    """Последние сообщения активного чата; более старые — с before_id первого полученного"""
     try:
         active_chat = chat_bot.get_active_chat(user_id)
         if not active_chat:
-            return {"status": "success", "messages": []}
+            return {"status": "success", "messages": [], "has_more": False}
 
-        messages = chat_bot.get_messages(active_chat["id"])
+        messages, has_more = chat_bot.get_messages_page(active_chat["id"], before_id, limit)
         return {
             "status": "success",
             "messages": messages,
+            "has_more": has_more,
             "active_chat": active_chat
         }
     except Exception as e:
@@ -97,14 +159,46 @@ async def get_chat_messages(user_id: int = Depends(get_user_id)):
 
 @router.post('/send')
 async def send_message(
+    request: Request,
     chat_message: ChatMessage,
     user_id: int = Depends(get_user_id)
 ):
     try:
-        response = chat_bot.get_response(user_id, chat_message.message)
+        response = await run_until_disconnected(
+            request, chat_bot.get_response(user_id, chat_message.message)
+        )
+        if response is None:
+            return {"status": "error", "error": "Client disconnected"}
         return {
             "status": "success",
             "response": response
         }
     except Exception as e:
         return {"status": "error", "error": str(e)}
+
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.post('/send_stream')
+async def send_message_stream(
+    chat_message: ChatMessage,
+    user_id: int = Depends(get_user_id)
+):
+    """Ответ бота по мере генерации через Server-Sent Events.
+    При отключении клиента StreamingResponse отменяет генератор, и запрос к LLM прерывается."""
+    async def events():
+        try:
+            async for event, text in chat_bot.stream_response(user_id, chat_message.message):
+                yield format_sse(event, {"text": text})
+            yield format_sse("done", {"status": "success"})
+        except Exception as e:
+            print(f"Error in send_message_stream: {e}")
+            yield format_sse("done", {"status": "error", "error": str(e)})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
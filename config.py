@@ -11,4 +11,108 @@ DB_PATH = BASE_DIR / "users.db"
 TEMPLATES_DIR = BASE_DIR / "templates"
 STATIC_DIR = BASE_DIR / "static"
 
-IMAGES_DIR = STATIC_DIR / "img"
\ No newline at end of file
+IMAGES_DIR = STATIC_DIR / "img"
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+DB_POOL_HEALTHCHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTHCHECK_INTERVAL", "30"))
+
+DB_JOURNAL_MODE = os.getenv("DB_JOURNAL_MODE", "WAL")
+DB_SYNCHRONOUS = os.getenv("DB_SYNCHRONOUS", "NORMAL")
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "-16000"))  # отрицательное значение — в КиБ
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(64 * 1024 * 1024)))
+DB_TEMP_STORE = os.getenv("DB_TEMP_STORE", "MEMORY")
+DB_BUSY_TIMEOUT_MS = int(os.getenv("DB_BUSY_TIMEOUT_MS", "5000"))
+
+DB_LOCK_RETRIES = int(os.getenv("DB_LOCK_RETRIES", "5"))
+DB_LOCK_RETRY_BACKOFF = float(os.getenv("DB_LOCK_RETRY_BACKOFF", "0.05"))
+
+DB_CHECKPOINT_INTERVAL = float(os.getenv("DB_CHECKPOINT_INTERVAL", "60"))
+DB_CHECKPOINT_MODE = os.getenv("DB_CHECKPOINT_MODE", "PASSIVE")
+
+DB_PRAGMAS = {
+    "synchronous": DB_SYNCHRONOUS,
+    "cache_size": DB_CACHE_SIZE,
+    "mmap_size": DB_MMAP_SIZE,
+    "temp_store": DB_TEMP_STORE,
+    "busy_timeout": DB_BUSY_TIMEOUT_MS,
+}
+
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "10000"))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "60"))
+
+# 0 — писать прогресс квиза в базу сразу, без буфера
+PROGRESS_FLUSH_INTERVAL = float(os.getenv("PROGRESS_FLUSH_INTERVAL", "5"))
+
+CHART_CACHE_SIZE = int(os.getenv("CHART_CACHE_SIZE", "2048"))
+# пустая строка отключает дисковый кэш графиков
+CHART_CACHE_DIR = os.getenv("CHART_CACHE_DIR", str(BASE_DIR / ".chart_cache")) or None
+CHART_CACHE_WARMUP = os.getenv("CHART_CACHE_WARMUP", "false").lower() in ("1", "true", "yes")
+# "svg" — встроенный рендерер без зависимостей, "png" — через matplotlib
+CHART_FORMAT = os.getenv("CHART_FORMAT", "svg").lower()
+# процессы для отрисовки PNG через matplotlib; 0 — рисовать в текущем процессе
+CHART_RENDER_WORKERS = int(os.getenv("CHART_RENDER_WORKERS", "2"))
+CHART_RENDER_MAX_PENDING = int(os.getenv("CHART_RENDER_MAX_PENDING", "64"))
+
+# таймаут одного запроса к LLM, секунды
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+# сколько запросов к LLM выполняется одновременно, остальные ждут очереди
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# как часто проверять, не отключился ли клиент во время генерации
+LLM_DISCONNECT_POLL = float(os.getenv("LLM_DISCONNECT_POLL", "0.5"))
+
+# "gemini" — Google Gemini, "fake" — локальная имитация без сети для нагрузочных тестов
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini").lower()
+FAKE_LLM_LATENCY = float(os.getenv("FAKE_LLM_LATENCY", "0.5"))
+FAKE_LLM_TOKENS_PER_SEC = float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "40"))
+FAKE_LLM_FAILURE_RATE = float(os.getenv("FAKE_LLM_FAILURE_RATE", "0"))
+FAKE_LLM_RESPONSE_TOKENS = int(os.getenv("FAKE_LLM_RESPONSE_TOKENS", "120"))
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED")) if os.getenv("FAKE_LLM_SEED") else None
+# сколько запрос к чату ждёт фоновую инициализацию LLM, прежде чем ответить заглушкой
+LLM_INIT_TIMEOUT = float(os.getenv("LLM_INIT_TIMEOUT", "10"))
+
+# кэш ответов бота на первые короткие вопросы в чате; 0 — выключен
+CHAT_RESPONSE_CACHE_SIZE = int(os.getenv("CHAT_RESPONSE_CACHE_SIZE", "1000"))
+CHAT_RESPONSE_CACHE_TTL = float(os.getenv("CHAT_RESPONSE_CACHE_TTL", "3600"))
+# кэшируются только диалоги не длиннее стольких сообщений и вопросы не длиннее стольких символов
+CHAT_RESPONSE_CACHE_MAX_MESSAGES = int(os.getenv("CHAT_RESPONSE_CACHE_MAX_MESSAGES", "1"))
+CHAT_RESPONSE_CACHE_MAX_CHARS = int(os.getenv("CHAT_RESPONSE_CACHE_MAX_CHARS", "200"))
+
+# бюджет контекста бота в приблизительных токенах: хвост переписки и сводка более ранней части
+CHAT_CONTEXT_TOKENS = int(os.getenv("CHAT_CONTEXT_TOKENS", "1500"))
+CHAT_SUMMARY_TOKENS = int(os.getenv("CHAT_SUMMARY_TOKENS", "300"))
+# сколько последних сообщений максимум читается из базы для промпта
+CHAT_CONTEXT_MAX_MESSAGES = int(os.getenv("CHAT_CONTEXT_MAX_MESSAGES", "20"))
+
+# кэш последних сообщений чатов в памяти: сколько чатов и сколько сообщений на чат
+CHAT_HISTORY_CHATS = int(os.getenv("CHAT_HISTORY_CHATS", "1000"))
+CHAT_HISTORY_MESSAGES = int(os.getenv("CHAT_HISTORY_MESSAGES", "50"))
+
+# размер страницы истории чата и списка чатов; клиент может запросить не больше CHAT_PAGE_MAX
+CHAT_PAGE_SIZE = int(os.getenv("CHAT_PAGE_SIZE", "30"))
+CHAT_PAGE_MAX = int(os.getenv("CHAT_PAGE_MAX", "100"))
+
+REVIEWS_PAGE_SIZE = int(os.getenv("REVIEWS_PAGE_SIZE", "20"))
+REVIEWS_PAGE_MAX = int(os.getenv("REVIEWS_PAGE_MAX", "100"))
+
+# число воркеров uvicorn (uvicorn читает ту же переменную, если не задан --workers)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+
+# кэш ленты отзывов в памяти: страниц по сортировке и курсору, пользователей с их лайками; 0 — выключен
+REVIEW_FEED_CACHE_PAGES = int(os.getenv("REVIEW_FEED_CACHE_PAGES", "200"))
+REVIEW_FEED_CACHE_USERS = int(os.getenv("REVIEW_FEED_CACHE_USERS", "1000"))
+# запасной срок жизни записей — для изменений, сделанных в обход процесса. Кэш не сбрасывается
+# записями других воркеров, поэтому с несколькими воркерами срок короткий: автор видит свой отзыв
+REVIEW_FEED_CACHE_TTL = float(os.getenv("REVIEW_FEED_CACHE_TTL", "300" if WEB_CONCURRENCY <= 1 else "5"))
+# как часто пересчитываются строки «N минут назад» в закэшированных страницах, секунды
+REVIEW_TIME_AGO_REFRESH = float(os.getenv("REVIEW_TIME_AGO_REFRESH", "60"))
+
+# счётчики лайков отзывов копятся в памяти и пишутся в базу раз в столько секунд; 0 — сразу.
+# Буфер локален для процесса, а сверка вычитает только свои дельты, поэтому с несколькими
+# воркерами он выключен: сверка посчитала бы ещё не сброшенные лайки других воркеров дважды
+LIKE_FLUSH_INTERVAL = float(os.getenv("LIKE_FLUSH_INTERVAL", "2")) if WEB_CONCURRENCY <= 1 else 0
+# как часто счётчики лайков сверяются с review_likes, секунды; 0 — не сверять
+LIKE_RECONCILE_INTERVAL = float(os.getenv("LIKE_RECONCILE_INTERVAL", "3600"))
+# как часто буфер истории чата сверяется с MAX(id) сообщений в базе, секунды; -1 — не сверять.
+# С одним воркером все сообщения проходят через его буфер, и сверка не нужна
+CHAT_HISTORY_REVALIDATE = float(os.getenv("CHAT_HISTORY_REVALIDATE", "1")) if WEB_CONCURRENCY > 1 else -1
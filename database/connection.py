@@ -1,121 +1,355 @@
+import os
+import random
 import sqlite3
-from config import DB_PATH
+import threading
+import time
+from collections import deque
+from functools import wraps
+from database.migrations import apply_migrations
+from config import (
+    DB_PATH,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_POOL_HEALTHCHECK_INTERVAL,
+    DB_PRAGMAS,
+    DB_JOURNAL_MODE,
+    DB_BUSY_TIMEOUT_MS,
+    DB_LOCK_RETRIES,
+    DB_LOCK_RETRY_BACKOFF,
+    DB_CHECKPOINT_INTERVAL,
+    DB_CHECKPOINT_MODE,
+)
 
-def get_db_connection():
-    return sqlite3.connect(DB_PATH)
 
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Свободное соединение не появилось за DB_POOL_TIMEOUT секунд"""
+
+
+class ConnectionPool:
+    """Ограниченный потокобезопасный пул соединений SQLite.
+
+    Соединения создаются лениво (не больше max_size на процесс), прагмы
+    применяются один раз при создании, перед выдачей давно простаивавшее
+    соединение проверяется через SELECT 1.
+    """
+
+    def __init__(self, db_path, max_size: int, timeout: float, healthcheck_interval: float):
+        self.db_path = str(db_path)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self.pid = os.getpid()
+
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._size = 0
+        self._closed = False
+
+        self._stats = {
+            "created": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "total_wait_ms": 0.0,
+            "max_wait_ms": 0.0,
+            "healthcheck_failures": 0,
+        }
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path, timeout=DB_BUSY_TIMEOUT_MS / 1000, check_same_thread=False
+        )
+        for name, value in DB_PRAGMAS.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _is_healthy(self, conn: sqlite3.Connection) -> bool:
+        try:
+            conn.execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+    def acquire(self) -> sqlite3.Connection:
+        started = time.monotonic()
+        waited = False
+
+        with self._available:
+            if self._closed:
+                raise sqlite3.ProgrammingError("Connection pool is closed")
+
+            while not self._idle and self._size >= self.max_size:
+                waited = True
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available after {self.timeout}s"
+                    )
+                self._available.wait(remaining)
+
+            if self._idle:
+                conn, last_used = self._idle.pop()
+            else:
+                conn, last_used = None, None
+                self._size += 1
+
+            wait_ms = (time.monotonic() - started) * 1000
+            self._stats["checkouts"] += 1
+            if waited:
+                self._stats["waits"] += 1
+                self._stats["total_wait_ms"] += wait_ms
+                self._stats["max_wait_ms"] = max(self._stats["max_wait_ms"], wait_ms)
+
+        try:
+            if conn is not None and time.monotonic() - last_used > self.healthcheck_interval:
+                if not self._is_healthy(conn):
+                    with self._lock:
+                        self._stats["healthcheck_failures"] += 1
+                    self._close_quietly(conn)
+                    conn = None
+
+            if conn is None:
+                conn = self._connect()
+                with self._lock:
+                    self._stats["created"] += 1
+        except Exception:
+            with self._available:
+                self._size -= 1
+                self._available.notify()
+            raise
+
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        broken = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            broken = True
+
+        with self._available:
+            if broken or self._closed:
+                self._size -= 1
+                self._close_quietly(conn)
+            else:
+                self._idle.append((conn, time.monotonic()))
+            self._available.notify()
+
+    def close(self):
+        with self._available:
+            self._closed = True
+            while self._idle:
+                conn, _ = self._idle.pop()
+                self._size -= 1
+                self._close_quietly(conn)
+            self._available.notify_all()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats.update({
+                "max_size": self.max_size,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+            })
+        stats["avg_wait_ms"] = round(stats["total_wait_ms"] / stats["waits"], 3) if stats["waits"] else 0.0
+        return stats
+
+    @staticmethod
+    def _close_quietly(conn: sqlite3.Connection):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
+class PooledConnection:
+    """Контекстный менеджер: берет соединение из пула и возвращает его обратно.
+
+    Внутри `with` ведет себя как sqlite3.Connection: commit при успехе,
+    rollback при исключении.
+    """
+
+    def __init__(self, pool: ConnectionPool):
+        self._pool = pool
+        self._conn = None
+
+    def __enter__(self) -> sqlite3.Connection:
+        self._conn = self._pool.acquire()
+        return self._conn
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        conn, self._conn = self._conn, None
+        try:
+            conn.__exit__(exc_type, exc_value, traceback)
+        finally:
+            self._pool.release(conn)
+        return False
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    pool = _pool
+    # после fork (несколько воркеров uvicorn) у каждого процесса свой пул
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = ConnectionPool(
+                    DB_PATH,
+                    max_size=DB_POOL_SIZE,
+                    timeout=DB_POOL_TIMEOUT,
+                    healthcheck_interval=DB_POOL_HEALTHCHECK_INTERVAL,
+                )
+            pool = _pool
+    return pool
+
+
+def get_db_connection() -> PooledConnection:
+    return PooledConnection(get_pool())
+
+
+def get_pool_stats() -> dict:
+    return get_pool().stats()
+
+
+def close_pool():
+    global _pool
+    stop_checkpointer()
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+_storage_stats = {
+    "lock_retries": 0,
+    "lock_failures": 0,
+    "checkpoints": 0,
+    "checkpoint_errors": 0,
+    "last_checkpoint": None,
+}
+_storage_stats_lock = threading.Lock()
+
+
+def _count(name: str, amount: int = 1):
+    with _storage_stats_lock:
+        _storage_stats[name] += amount
+
+
+def _is_locked_error(error: sqlite3.OperationalError) -> bool:
+    message = str(error).lower()
+    return "database is locked" in message or "database is busy" in message
+
+
+def retry_on_locked(func):
+    """Повторяет запрос с экспоненциальной задержкой, если база занята записью.
+
+    Транзакция при ошибке откатывается в `with get_db_connection()`,
+    поэтому повтор безопасен.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except sqlite3.OperationalError as e:
+                if isinstance(e, PoolTimeoutError) or not _is_locked_error(e):
+                    raise
+                if attempt >= DB_LOCK_RETRIES:
+                    _count("lock_failures")
+                    raise
+                _count("lock_retries")
+                delay = DB_LOCK_RETRY_BACKOFF * (2 ** attempt)
+                time.sleep(delay + random.uniform(0, delay))
+                attempt += 1
+    return wrapper
+
+
+def checkpoint(mode: str = DB_CHECKPOINT_MODE):
+    """Переносит страницы из WAL-файла в основную базу"""
+    try:
+        with get_db_connection() as conn:
+            busy, log_pages, checkpointed = conn.execute(
+                f"PRAGMA wal_checkpoint({mode})"
+            ).fetchone()
+        with _storage_stats_lock:
+            _storage_stats["checkpoints"] += 1
+            _storage_stats["last_checkpoint"] = {
+                "mode": mode,
+                "busy": busy,
+                "log_pages": log_pages,
+                "checkpointed": checkpointed,
+                "at": time.time(),
+            }
+    except sqlite3.Error as e:
+        _count("checkpoint_errors")
+        print(f"Ошибка checkpoint: {e}")
+
+
+_checkpointer = None
+_checkpointer_stop = threading.Event()
+
+
+def _checkpoint_loop():
+    while not _checkpointer_stop.wait(DB_CHECKPOINT_INTERVAL):
+        checkpoint()
+
+
+def start_checkpointer():
+    global _checkpointer
+    if DB_JOURNAL_MODE.upper() != "WAL" or DB_CHECKPOINT_INTERVAL <= 0:
+        return
+    if _checkpointer is not None and _checkpointer.is_alive():
+        return
+    _checkpointer_stop.clear()
+    _checkpointer = threading.Thread(target=_checkpoint_loop, name="sqlite-checkpointer", daemon=True)
+    _checkpointer.start()
+
+
+def stop_checkpointer():
+    global _checkpointer
+    if _checkpointer is None:
+        return
+    _checkpointer_stop.set()
+    _checkpointer.join(timeout=5)
+    _checkpointer = None
+    checkpoint("TRUNCATE")
+
+
+def get_storage_stats() -> dict:
+    with get_db_connection() as conn:
+        journal_mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+        settings = {
+            name: conn.execute(f"PRAGMA {name}").fetchone()[0]
+            for name in DB_PRAGMAS
+        }
+    with _storage_stats_lock:
+        stats = dict(_storage_stats)
+    stats["journal_mode"] = journal_mode
+    stats["pragmas"] = settings
+    return stats
+
+
+def configure_storage():
+    # journal_mode сохраняется в самом файле базы, поэтому задается один раз
+    with get_db_connection() as conn:
+        mode = conn.execute(f"PRAGMA journal_mode = {DB_JOURNAL_MODE}").fetchone()[0]
+    if mode.upper() != DB_JOURNAL_MODE.upper():
+        print(f"SQLite: не удалось включить journal_mode={DB_JOURNAL_MODE}, используется {mode}")
 
 
 def init_db():
+    configure_storage()
     with get_db_connection() as conn:
-        cursor = conn.cursor()
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT NOT NULL,
-                email TEXT NOT NULL UNIQUE,
-                password TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_answers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                answers TEXT NOT NULL,
-                results_json TEXT NOT NULL,
-                completed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                ip_address TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS quiz_progress (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                current_question INTEGER DEFAULT 0,
-                answers_json TEXT NOT NULL,
-                results_json TEXT,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                UNIQUE(user_id)
-            )
-        ''')
-
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_chats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS chat_messages (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                chat_id INTEGER NOT NULL,
-                role TEXT NOT NULL, -- 'user' или 'assistant'
-                content TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (chat_id) REFERENCES user_chats (id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_active_chats (
-                user_id INTEGER PRIMARY KEY,
-                active_chat_id INTEGER,
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (active_chat_id) REFERENCES user_chats (id)
-            )
-        ''')
-        cursor.execute('''
-            -- Таблица для отзывов
-            CREATE TABLE IF NOT EXISTS reviews (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5),
-                comment TEXT,
-                likes INTEGER DEFAULT 0,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                UNIQUE(user_id)
-            )
-        ''')
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS review_likes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                review_id INTEGER NOT NULL,
-                user_id INTEGER NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (review_id) REFERENCES reviews(id),
-                FOREIGN KEY (user_id) REFERENCES users(id),
-                UNIQUE(review_id, user_id)
-            )           
-        ''')
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS user_oauth (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                provider TEXT NOT NULL,  -- 'google', 'github', etc.
-                provider_id TEXT NOT NULL,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
-                UNIQUE(user_id, provider)
-            )
-        ''')
-        
-        conn.commit()
+        applied = apply_migrations(conn)
+    if applied:
+        print(f"SQLite: применены миграции {applied}")
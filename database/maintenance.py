@@ -0,0 +1,73 @@
+"""Служебные команды для users.db.
+
+    python -m database.maintenance review-stats           # сверить и пересчитать review_stats
+    python -m database.maintenance review-stats --check   # только сверить, код выхода 1 при расхождении
+    python -m database.maintenance review-likes           # пересчитать reviews.likes по review_likes
+    python -m database.maintenance review-likes --check
+
+Приложение копит изменения счётчиков лайков в памяти (LIKE_FLUSH_INTERVAL) и само
+сверяет их раз в LIKE_RECONCILE_INTERVAL, вычитая ещё не сброшенные дельты. Команды
+отсюда этих дельт не видят: обе без --check запускать только при остановленном
+приложении, иначе лайки из его буфера попадут в reviews.likes и total_likes дважды.
+При работающем приложении те же пересчёты — ReviewService.reconcile_likes
+и ReviewService.rebuild_review_stats.
+"""
+import argparse
+import sys
+from database.connection import init_db, close_pool
+from database.repositories import ReviewRepository
+
+
+def review_stats(check_only: bool) -> int:
+    report = ReviewRepository.rebuild_review_stats(check_only=check_only)
+    if report["consistent"]:
+        print("review_stats: расхождений нет")
+        return 0
+
+    stored = report["stored"] or {}
+    for column, actual in report["actual"].items():
+        if stored.get(column) != actual:
+            print(f"review_stats.{column}: {stored.get(column)} -> {actual}")
+    if check_only:
+        return 1
+    print("review_stats пересчитана")
+    return 0
+
+
+def review_likes(check_only: bool) -> int:
+    report = ReviewRepository.reconcile_like_counts(check_only=check_only)
+    for review_id, stored, actual in report["mismatched"]:
+        print(f"reviews.likes отзыва {review_id}: {stored} -> {actual}")
+    if not report["stats_consistent"]:
+        print("review_stats расходилась с таблицами отзывов")
+    if not report["mismatched"] and report["stats_consistent"]:
+        print("review-likes: расхождений нет")
+        return 0
+    if check_only:
+        return 1
+    print("счётчики лайков пересчитаны")
+    return 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m database.maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+    stats_parser = commands.add_parser("review-stats", help="сверить и пересчитать статистику отзывов (приложение должно быть остановлено)")
+    stats_parser.add_argument("--check", action="store_true", help="только сверить, ничего не менять")
+    likes_parser = commands.add_parser("review-likes", help="сверить и пересчитать счётчики лайков (приложение должно быть остановлено)")
+    likes_parser.add_argument("--check", action="store_true", help="только сверить, ничего не менять")
+    args = parser.parse_args(argv)
+
+    init_db()
+    try:
+        if args.command == "review-stats":
+            return review_stats(args.check)
+        if args.command == "review-likes":
+            return review_likes(args.check)
+    finally:
+        close_pool()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
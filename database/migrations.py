@@ -0,0 +1,310 @@
+"""Версионированные миграции схемы users.db.
+
+Каждая миграция применяется ровно один раз в отдельной транзакции, номер
+примененной версии записывается в таблицу schema_migrations. Новые
+изменения схемы добавляются новой функцией с декоратором @migration.
+"""
+import sqlite3
+from typing import Callable, List, Tuple
+from database.serialization import decode_legacy, encode_json
+
+MIGRATIONS: List[Tuple[int, str, Callable]] = []
+
+
+def migration(version: int, description: str):
+    def register(func):
+        MIGRATIONS.append((version, description, func))
+        return func
+    return register
+
+
+@migration(1, "Базовая схема")
+def _initial_schema(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT NOT NULL,
+            email TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_answers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            answers TEXT NOT NULL,
+            results_json TEXT NOT NULL,
+            completed_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            ip_address TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS quiz_progress (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            current_question INTEGER DEFAULT 0,
+            answers_json TEXT NOT NULL,
+            results_json TEXT,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            UNIQUE(user_id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_chats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            role TEXT NOT NULL, -- 'user' или 'assistant'
+            content TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (chat_id) REFERENCES user_chats (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_active_chats (
+            user_id INTEGER PRIMARY KEY,
+            active_chat_id INTEGER,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (active_chat_id) REFERENCES user_chats (id)
+        )
+    ''')
+    cursor.execute('''
+        -- Таблица для отзывов
+        CREATE TABLE IF NOT EXISTS reviews (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            rating INTEGER NOT NULL CHECK (rating >= 1 AND rating <= 5),
+            comment TEXT,
+            likes INTEGER DEFAULT 0,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            UNIQUE(user_id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS review_likes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            review_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (review_id) REFERENCES reviews(id),
+            FOREIGN KEY (user_id) REFERENCES users(id),
+            UNIQUE(review_id, user_id)
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_oauth (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            provider TEXT NOT NULL,  -- 'google', 'github', etc.
+            provider_id TEXT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id) ON DELETE CASCADE,
+            UNIQUE(user_id, provider)
+        )
+    ''')
+
+
+@migration(2, "Индексы для частых запросов")
+def _lookup_indexes(cursor: sqlite3.Cursor):
+    # verify_access на каждом авторизованном запросе; id берется из rowid индекса
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_sessions_user_ip ON user_sessions (user_id, ip_address)"
+    )
+    # DELETE по ip_address при входе
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_sessions_ip ON user_sessions (ip_address)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_answers_user_completed ON user_answers (user_id, completed_at)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_user_chats_user_updated ON user_chats (user_id, updated_at)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chat_messages_chat_created ON chat_messages (chat_id, created_at)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_review_likes_user ON review_likes (user_id, review_id)"
+    )
+    cursor.execute("ANALYZE")
+
+
+def _rewrite_legacy_column(cursor: sqlite3.Cursor, table: str, column: str):
+    rows = cursor.execute(
+        f"SELECT id, {column} FROM {table} WHERE {column} LIKE '{{''%'"
+    ).fetchall()
+    updates = []
+    for row_id, value in rows:
+        decoded = decode_legacy(value)
+        # нераспознанные строки оставляем как есть, decode_json их пропустит
+        if decoded is not None:
+            updates.append((encode_json(decoded), row_id))
+    cursor.executemany(f"UPDATE {table} SET {column} = ? WHERE id = ?", updates)
+
+
+@migration(3, "JSON вместо str(dict) в результатах и прогрессе квиза")
+def _json_quiz_payloads(cursor: sqlite3.Cursor):
+    _rewrite_legacy_column(cursor, "user_answers", "results_json")
+    _rewrite_legacy_column(cursor, "quiz_progress", "answers_json")
+    _rewrite_legacy_column(cursor, "quiz_progress", "results_json")
+
+
+@migration(4, "Отключение кэша ответов бота для отдельного чата")
+def _chat_response_cache_flag(cursor: sqlite3.Cursor):
+    cursor.execute(
+        "ALTER TABLE user_chats ADD COLUMN response_cache INTEGER NOT NULL DEFAULT 1"
+    )
+
+
+@migration(5, "Сводка старых сообщений чата для контекста бота")
+def _chat_summaries(cursor: sqlite3.Cursor):
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_summaries (
+            chat_id INTEGER PRIMARY KEY,
+            summary TEXT NOT NULL,
+            last_message_id INTEGER NOT NULL,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (chat_id) REFERENCES user_chats (id)
+        )
+    ''')
+    # хвост чата по id: ORDER BY id DESC LIMIT n без сортировки всей истории
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_chat_messages_chat_id ON chat_messages (chat_id, id)"
+    )
+    # запросы к сообщениям больше не сортируют по created_at, а индекс обновлялся бы на каждой вставке
+    cursor.execute("DROP INDEX IF EXISTS idx_chat_messages_chat_created")
+
+
+@migration(6, "Индексы для постраничной ленты отзывов")
+def _review_feed_indexes(cursor: sqlite3.Cursor):
+    # по одному индексу на порядок сортировки ленты (REVIEW_SORTS), id — последний ключ курсора
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reviews_created ON reviews (created_at, id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reviews_rating_created ON reviews (rating, created_at, id)"
+    )
+    # "lowest": рейтинг по возрастанию, внутри — новые первыми
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reviews_rating_created_desc ON reviews (rating, created_at DESC, id DESC)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_reviews_likes_created ON reviews (likes, created_at, id)"
+    )
+    cursor.execute("ANALYZE")
+
+
+def fill_review_stats(cursor: sqlite3.Cursor):
+    """Пересчитывает строку review_stats по таблицам reviews и review_likes"""
+    cursor.execute('''
+        INSERT OR REPLACE INTO review_stats (
+            id, reviews_count, rating_sum,
+            stars_1, stars_2, stars_3, stars_4, stars_5,
+            total_likes, updated_at
+        )
+        SELECT 1, COUNT(*), COALESCE(SUM(rating), 0),
+               COALESCE(SUM(rating = 1), 0), COALESCE(SUM(rating = 2), 0),
+               COALESCE(SUM(rating = 3), 0), COALESCE(SUM(rating = 4), 0),
+               COALESCE(SUM(rating = 5), 0),
+               (SELECT COUNT(*) FROM review_likes
+                WHERE review_id IN (SELECT id FROM reviews)),
+               CURRENT_TIMESTAMP
+        FROM reviews
+    ''')
+
+
+@migration(7, "Материализованная статистика отзывов")
+def _review_stats(cursor: sqlite3.Cursor):
+    # единственная строка id = 1, обновляется в одной транзакции с изменением отзывов
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS review_stats (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            reviews_count INTEGER NOT NULL DEFAULT 0,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            stars_1 INTEGER NOT NULL DEFAULT 0,
+            stars_2 INTEGER NOT NULL DEFAULT 0,
+            stars_3 INTEGER NOT NULL DEFAULT 0,
+            stars_4 INTEGER NOT NULL DEFAULT 0,
+            stars_5 INTEGER NOT NULL DEFAULT 0,
+            total_likes INTEGER NOT NULL DEFAULT 0,
+            updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    fill_review_stats(cursor)
+
+
+def _ensure_migrations_table(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+
+def get_schema_version(conn: sqlite3.Connection) -> int:
+    _ensure_migrations_table(conn)
+    row = conn.execute("SELECT MAX(version) FROM schema_migrations").fetchone()
+    return row[0] or 0
+
+
+def apply_migrations(conn: sqlite3.Connection) -> List[int]:
+    """Применяет все недостающие миграции, возвращает список примененных версий"""
+    _ensure_migrations_table(conn)
+    known = {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+    applied = []
+
+    for version, description, func in sorted(MIGRATIONS, key=lambda m: m[0]):
+        if version in known:
+            continue
+        # BEGIN IMMEDIATE берет блокировку записи, поэтому при одновременном
+        # старте нескольких воркеров миграцию выполнит только один из них
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            done = conn.execute(
+                "SELECT 1 FROM schema_migrations WHERE version = ?", (version,)
+            ).fetchone()
+            if done:
+                conn.rollback()
+                continue
+
+            func(conn.cursor())
+            conn.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            conn.commit()
+            applied.append(version)
+        except Exception:
+            conn.rollback()
+            raise
+
+    return applied
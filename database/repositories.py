@@ -1,12 +1,17 @@
 import sqlite3
-from typing import Optional, Dict, Any, List
-from database.connection import get_db_connection
+from typing import Optional, Dict, Any, List, Set, Tuple
+from database.connection import get_db_connection, retry_on_locked
+from database.migrations import fill_review_stats
+from database.serialization import encode_json, encode_results, decode_json
+from cache import TTLCache
+from config import SESSION_CACHE_SIZE, SESSION_CACHE_TTL
 
 
 
 
 class UserRepository:
     @staticmethod
+    @retry_on_locked
     def create_user(username: str, email: str, password: str) -> int:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -40,6 +45,7 @@ class UserRepository:
             return cursor.fetchone()
 
     @staticmethod
+    @retry_on_locked
     def save_oauth_info(user_id: int, provider: str, provider_id: str):
         """Сохранить информацию о OAuth провайдере"""
         with get_db_connection() as conn:
@@ -89,8 +95,15 @@ class UserRepository:
             cursor.execute("SELECT id, username, email, password FROM users")
             return cursor.fetchall()
 
+# Кэшируются только подтвержденные сессии: (user_id, ip_address) -> True.
+# Сессии, созданные другим воркером, подхватываются из базы при промахе,
+# а удаленные там же живут в этом кэше не дольше SESSION_CACHE_TTL.
+session_cache = TTLCache(maxsize=SESSION_CACHE_SIZE, ttl=SESSION_CACHE_TTL)
+
+
 class SessionRepository:
     @staticmethod
+    @retry_on_locked
     def create_session(user_id: int, ip_address: str):
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -103,15 +116,29 @@ class SessionRepository:
             )
             conn.commit()
 
+        session_cache.delete_matching(lambda key: key[1] == ip_address)
+        session_cache.set((user_id, ip_address), True)
+
     @staticmethod
     def verify_access(user_id: int, ip_address: str) -> bool:
+        if session_cache.get((user_id, ip_address)):
+            return True
+
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT id FROM user_sessions WHERE user_id = ? AND ip_address = ?",
                 (user_id, ip_address)
             )
-            return cursor.fetchone() is not None
+            found = cursor.fetchone() is not None
+
+        if found:
+            session_cache.set((user_id, ip_address), True)
+        return found
+
+    @staticmethod
+    def get_cache_stats() -> dict:
+        return session_cache.stats()
 
     @staticmethod
     def get_all_sessions():
@@ -124,12 +151,33 @@ class SessionRepository:
 
 class QuizRepository:
     @staticmethod
+    @retry_on_locked
     def save_answers(user_id: int, answers: str, results: dict):
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT INTO user_answers (user_id, answers, results_json) VALUES (?, ?, ?)",
-                (user_id, answers, str(results))
+                (user_id, answers, encode_results(results))
+            )
+            conn.commit()
+
+    @staticmethod
+    def get_all_answers() -> List[tuple]:
+        """Все сохраненные прохождения: (id, answers)"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT id, answers FROM user_answers")
+            return cursor.fetchall()
+
+    @staticmethod
+    @retry_on_locked
+    def update_results_many(results: List[tuple]):
+        """results — список (answer_id, results_dict)"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "UPDATE user_answers SET results_json = ? WHERE id = ?",
+                [(encode_results(r), answer_id) for answer_id, r in results]
             )
             conn.commit()
 
@@ -144,6 +192,7 @@ class QuizRepository:
             return cursor.fetchone()
 
     @staticmethod
+    @retry_on_locked
     def save_quiz_progress(user_id: int, current_question: int, answers: dict, results: dict = None):
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -151,7 +200,27 @@ class QuizRepository:
                 INSERT OR REPLACE INTO quiz_progress 
                 (user_id, current_question, answers_json, results_json, updated_at)
                 VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (user_id, current_question, str(answers), str(results) if results else None))
+            ''', (user_id, current_question, encode_json(answers or {}), encode_json(results) if results else None))
+            conn.commit()
+
+    @staticmethod
+    @retry_on_locked
+    def save_quiz_progress_many(progress: List[tuple]):
+        """Сохранить прогресс нескольких пользователей одной транзакцией.
+
+        progress — список (user_id, current_question, answers, results)
+        """
+        rows = [
+            (user_id, current_question, encode_json(answers or {}), encode_json(results) if results else None)
+            for user_id, current_question, answers, results in progress
+        ]
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.executemany('''
+                INSERT OR REPLACE INTO quiz_progress 
+                (user_id, current_question, answers_json, results_json, updated_at)
+                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+            ''', rows)
             conn.commit()
 
     @staticmethod
@@ -166,12 +235,13 @@ class QuizRepository:
             if result:
                 return {
                     'current_question': result[0],
-                    'answers': eval(result[1]) if result[1] else {},
-                    'results': eval(result[2]) if result[2] else None
+                    'answers': decode_json(result[1]) or {},
+                    'results': decode_json(result[2])
                 }
             return None
 
     @staticmethod
+    @retry_on_locked
     def clear_quiz_progress(user_id: int):
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -182,6 +252,7 @@ class QuizRepository:
 
 class ChatRepository:
     @staticmethod
+    @retry_on_locked
     def create_chat(user_id: int, title: str) -> int:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -194,15 +265,31 @@ class ChatRepository:
             return chat_id
 
     @staticmethod
-    def get_user_chats(user_id: int) -> List[dict]:
+    def get_user_chats(user_id: int, after: Optional[list] = None, limit: int = -1) -> List[dict]:
+        """Чаты пользователя от последних обновленных к старым.
+        after — курсор [updated_at, id] последнего чата предыдущей страницы"""
+        if after is not None and len(after) != 2:
+            raise ValueError("Курсор не подходит к списку чатов")
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT id, title, created_at, updated_at 
-                FROM user_chats 
-                WHERE user_id = ? 
-                ORDER BY updated_at DESC
-            ''', (user_id,))
+            if after is None:
+                cursor.execute('''
+                    SELECT id, title, created_at, updated_at 
+                    FROM user_chats 
+                    WHERE user_id = ? 
+                    ORDER BY updated_at DESC, id DESC
+                    LIMIT ?
+                ''', (user_id, limit))
+            else:
+                # значения курсора, а не текущая строка чата: удаление или обновление
+                # этого чата не сдвигает уже отданные страницы
+                cursor.execute('''
+                    SELECT id, title, created_at, updated_at
+                    FROM user_chats
+                    WHERE user_id = ? AND (updated_at, id) < (?, ?)
+                    ORDER BY updated_at DESC, id DESC
+                    LIMIT ?
+                ''', (user_id, *after, limit))
             chats = cursor.fetchall()
 
             return [{
@@ -213,6 +300,7 @@ class ChatRepository:
             } for chat in chats]
 
     @staticmethod
+    @retry_on_locked
     def set_active_chat(user_id: int, chat_id: int) -> bool:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -235,7 +323,7 @@ class ChatRepository:
         with get_db_connection() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT uc.id, uc.title, uc.created_at, uc.updated_at
+                SELECT uc.id, uc.title, uc.created_at, uc.updated_at, uc.response_cache
                 FROM user_chats uc
                 JOIN user_active_chats uac ON uc.id = uac.active_chat_id
                 WHERE uac.user_id = ?
@@ -248,12 +336,26 @@ class ChatRepository:
                     "id": chat[0],
                     "title": chat[1],
                     "created_at": chat[2],
-                    "updated_at": chat[3]
+                    "updated_at": chat[3],
+                    "response_cache": bool(chat[4])
                 }
             print(f"REPOSITORY: No active chat found")
             return None
     
     @staticmethod
+    @retry_on_locked
+    def set_response_cache(user_id: int, chat_id: int, enabled: bool) -> bool:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "UPDATE user_chats SET response_cache = ? WHERE id = ? AND user_id = ?",
+                (int(enabled), chat_id, user_id)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+
+    @staticmethod
+    @retry_on_locked
     def delete_chat(user_id: int, chat_id: int) -> bool:
         with get_db_connection() as conn:
             cursor = conn.cursor()
@@ -266,6 +368,8 @@ class ChatRepository:
 
             cursor.execute(
                 "DELETE FROM chat_messages WHERE chat_id = ?", (chat_id,))
+            cursor.execute(
+                "DELETE FROM chat_summaries WHERE chat_id = ?", (chat_id,))
             cursor.execute("DELETE FROM user_chats WHERE id = ?", (chat_id,))
 
             cursor.execute(
@@ -283,7 +387,8 @@ class ChatRepository:
             return True
 
     @staticmethod
-    def add_message(chat_id: int, role: str, content: str):
+    @retry_on_locked
+    def add_message(chat_id: int, role: str, content: str) -> dict:
         print(
             f"REPOSITORY: Adding message to chat {chat_id}, role: {role}, content: {content[:50]}...")
         with get_db_connection() as conn:
@@ -292,12 +397,23 @@ class ChatRepository:
                 "INSERT INTO chat_messages (chat_id, role, content) VALUES (?, ?, ?)",
                 (chat_id, role, content)
             )
+            message_id = cursor.lastrowid
             cursor.execute(
                 "UPDATE user_chats SET updated_at = CURRENT_TIMESTAMP WHERE id = ?",
                 (chat_id,)
             )
+            cursor.execute(
+                "SELECT created_at FROM chat_messages WHERE id = ?", (message_id,)
+            )
+            created_at = cursor.fetchone()[0]
             conn.commit()
         print(f"REPOSITORY: Message added successfully")
+        return {
+            "id": message_id,
+            "role": role,
+            "content": content,
+            "created_at": created_at
+        }
 
 
     @staticmethod
@@ -305,31 +421,288 @@ class ChatRepository:
         print(f"REPOSITORY: Getting messages for chat {chat_id}")
         with get_db_connection() as conn:
             cursor = conn.cursor()
-
-        
-            cursor.execute("SELECT id FROM user_chats WHERE id = ?", (chat_id,))
-            chat_exists = cursor.fetchone()
-            print(f"REPOSITORY: Chat exists: {bool(chat_exists)}")
-
             cursor.execute('''
-                SELECT role, content, created_at 
+                SELECT id, role, content, created_at
                 FROM chat_messages 
                 WHERE chat_id = ? 
-                ORDER BY created_at ASC
+                ORDER BY id ASC
             ''', (chat_id,))
             messages = cursor.fetchall()
 
             print(f"REPOSITORY: Found {len(messages)} messages in database")
 
             return [{
-                "role": msg[0],
-                "content": msg[1],
-                "created_at": msg[2]
+                "id": msg[0],
+                "role": msg[1],
+                "content": msg[2],
+                "created_at": msg[3]
             } for msg in messages]
 
+    @staticmethod
+    def get_recent_messages(chat_id: int, limit: int, after_id: int = 0) -> List[dict]:
+        """Последние limit сообщений чата с id > after_id, по возрастанию id"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, role, content, created_at
+                FROM chat_messages
+                WHERE chat_id = ? AND id > ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (chat_id, after_id, limit))
+            messages = cursor.fetchall()
+
+            return [{
+                "id": msg[0],
+                "role": msg[1],
+                "content": msg[2],
+                "created_at": msg[3]
+            } for msg in reversed(messages)]
+
+    @staticmethod
+    def get_last_message_id(chat_id: int) -> int:
+        """id последнего сообщения чата, 0 — сообщений нет"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT MAX(id) FROM chat_messages WHERE chat_id = ?", (chat_id,))
+            return cursor.fetchone()[0] or 0
+
+    @staticmethod
+    def get_messages_page(chat_id: int, before_id: Optional[int], limit: int) -> List[dict]:
+        """Страница истории: limit сообщений с id < before_id (или последних), по возрастанию id"""
+        if before_id is None:
+            return ChatRepository.get_recent_messages(chat_id, limit)
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, role, content, created_at
+                FROM chat_messages
+                WHERE chat_id = ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (chat_id, before_id, limit))
+            messages = cursor.fetchall()
+
+            return [{
+                "id": msg[0],
+                "role": msg[1],
+                "content": msg[2],
+                "created_at": msg[3]
+            } for msg in reversed(messages)]
+
+    @staticmethod
+    def get_messages_between(chat_id: int, after_id: int, before_id: int, limit: int) -> List[dict]:
+        """Сообщения с after_id < id < before_id, не больше limit самых новых"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, role, content, created_at
+                FROM chat_messages
+                WHERE chat_id = ? AND id > ? AND id < ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (chat_id, after_id, before_id, limit))
+            messages = cursor.fetchall()
+
+            return [{
+                "id": msg[0],
+                "role": msg[1],
+                "content": msg[2],
+                "created_at": msg[3]
+            } for msg in reversed(messages)]
+
+    @staticmethod
+    def get_summary(chat_id: int) -> Optional[dict]:
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                "SELECT summary, last_message_id FROM chat_summaries WHERE chat_id = ?",
+                (chat_id,)
+            )
+            row = cursor.fetchone()
+            if row:
+                return {"summary": row[0], "last_message_id": row[1]}
+            return None
+
+    @staticmethod
+    @retry_on_locked
+    def save_summary(chat_id: int, summary: str, last_message_id: int):
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT OR REPLACE INTO chat_summaries (chat_id, summary, last_message_id, updated_at)
+                VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ''', (chat_id, summary, last_message_id))
+            conn.commit()
+
+
+# сортировки ленты отзывов: ORDER BY, условие "строго после курсора" и поля отзыва,
+# из которых состоит курсор (по порядку параметров условия). id делает порядок полным
+REVIEW_SORTS = {
+    "newest": (
+        "r.created_at DESC, r.id DESC",
+        "(r.created_at, r.id) < (?, ?)",
+        ("created_at", "id"),
+    ),
+    "oldest": (
+        "r.created_at ASC, r.id ASC",
+        "(r.created_at, r.id) > (?, ?)",
+        ("created_at", "id"),
+    ),
+    "highest": (
+        "r.rating DESC, r.created_at DESC, r.id DESC",
+        "(r.rating, r.created_at, r.id) < (?, ?, ?)",
+        ("rating", "created_at", "id"),
+    ),
+    "lowest": (
+        "r.rating ASC, r.created_at DESC, r.id DESC",
+        # направления разные, поэтому без row value; r.rating >= ? даёт поиск по индексу
+        "(r.rating >= ? AND (r.rating > ? OR (r.created_at, r.id) < (?, ?)))",
+        ("rating", "rating", "created_at", "id"),
+    ),
+    "popular": (
+        "r.likes DESC, r.created_at DESC, r.id DESC",
+        "(r.likes, r.created_at, r.id) < (?, ?, ?)",
+        ("likes", "created_at", "id"),
+    ),
+}
+
+
+REVIEW_STATS_COLUMNS = (
+    "reviews_count", "rating_sum", "stars_1", "stars_2", "stars_3",
+    "stars_4", "stars_5", "total_likes"
+)
+
+
+def _update_review_stats(
+    cursor: sqlite3.Cursor,
+    count: int = 0,
+    stars: Optional[Dict[int, int]] = None,
+    likes: int = 0
+):
+    """Изменяет review_stats на дельты; вызывается в транзакции изменения отзыва.
+    stars — {оценка: изменение числа отзывов с этой оценкой}"""
+    stars = stars or {}
+    star_deltas = [stars.get(rating, 0) for rating in range(1, 6)]
+    rating_sum = sum(rating * delta for rating, delta in stars.items())
+    cursor.execute('''
+        UPDATE review_stats
+        SET reviews_count = reviews_count + ?,
+            rating_sum = rating_sum + ?,
+            stars_1 = stars_1 + ?,
+            stars_2 = stars_2 + ?,
+            stars_3 = stars_3 + ?,
+            stars_4 = stars_4 + ?,
+            stars_5 = stars_5 + ?,
+            total_likes = total_likes + ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1
+    ''', (count, rating_sum, *star_deltas, likes))
+
+
+def _review_stats_from_row(row) -> dict:
+    values = dict(zip(REVIEW_STATS_COLUMNS, row or (0,) * len(REVIEW_STATS_COLUMNS)))
+    count = values["reviews_count"]
+    return {
+        "reviews_count": count,
+        "average_rating": round(values["rating_sum"] / count, 1) if count else 0,
+        "rating_distribution": {
+            str(rating): values[f"stars_{rating}"] for rating in range(1, 6)
+        },
+        "total_likes": values["total_likes"]
+    }
+
+
+def _select_reviews_page(
+    cursor: sqlite3.Cursor,
+    sort_by: str,
+    after: Optional[list],
+    limit: int,
+    user_id: Optional[int] = None
+) -> Tuple[List[dict], Optional[list]]:
+    """Страница отзывов по курсору: (отзывы, next_cursor или None).
+    С user_id у каждого отзыва есть флаг user_has_liked."""
+    order_by, after_condition, cursor_fields = REVIEW_SORTS.get(sort_by, REVIEW_SORTS["newest"])
+    where = f"WHERE {after_condition}" if after is not None else ""
+    if after is not None and len(after) != len(cursor_fields):
+        raise ValueError("Курсор не подходит к сортировке")
+    # на одну строку больше, чтобы узнать, есть ли следующая страница
+    fetch = limit + 1 if limit > 0 else -1
+
+    liked_column = "NULL"
+    params = ()
+    if user_id is not None:
+        liked_column = "EXISTS (SELECT 1 FROM review_likes rl WHERE rl.review_id = r.id AND rl.user_id = ?)"
+        params = (user_id,)
+    cursor.execute(f'''
+        SELECT r.id, r.user_id, u.username, r.rating, r.comment, 
+               r.likes, r.created_at, r.updated_at,
+               {liked_column}
+        FROM reviews r
+        JOIN users u ON r.user_id = u.id
+        {where}
+        ORDER BY {order_by}
+        LIMIT ?
+    ''', (*params, *(after or ()), fetch))
+    rows = cursor.fetchall()
+
+    has_more = limit > 0 and len(rows) > limit
+    if has_more:
+        rows = rows[:limit]
+
+    reviews = []
+    for review in rows:
+        item = {
+            "id": review[0],
+            "user_id": review[1],
+            "username": review[2],
+            "rating": review[3],
+            "comment": review[4],
+            "likes": review[5],
+            "created_at": review[6],
+            "updated_at": review[7]
+        }
+        if user_id is not None:
+            item["user_has_liked"] = bool(review[8])
+        reviews.append(item)
+
+    next_cursor = None
+    if has_more:
+        next_cursor = [reviews[-1][field] for field in cursor_fields]
+    return reviews, next_cursor
+
+
+def _select_review_stats(cursor: sqlite3.Cursor) -> dict:
+    cursor.execute(f"SELECT {', '.join(REVIEW_STATS_COLUMNS)} FROM review_stats WHERE id = 1")
+    return _review_stats_from_row(cursor.fetchone())
+
+
+def _select_user_review(cursor: sqlite3.Cursor, user_id: int) -> Optional[dict]:
+    cursor.execute('''
+        SELECT r.id, r.user_id, u.username, r.rating, r.comment, 
+               r.likes, r.created_at, r.updated_at
+        FROM reviews r
+        JOIN users u ON r.user_id = u.id
+        WHERE r.user_id = ?
+    ''', (user_id,))
+    own = cursor.fetchone()
+    if not own:
+        return None
+    return {
+        "id": own[0],
+        "user_id": own[1],
+        "username": own[2],
+        "rating": own[3],
+        "comment": own[4],
+        "likes": own[5],
+        "created_at": own[6],
+        "updated_at": own[7]
+    }
+
 
 class ReviewRepository:
     @staticmethod
+    @retry_on_locked
     def create_review(user_id: int, rating: int, comment: str) -> bool:
         """Создание отзыва (один отзыв на пользователя)"""
         try:
@@ -339,6 +712,7 @@ class ReviewRepository:
                     "INSERT INTO reviews (user_id, rating, comment, created_at) VALUES (?, ?, ?, datetime('now', 'localtime'))",
                     (user_id, rating, comment)
                 )
+                _update_review_stats(cursor, count=1, stars={rating: 1})
                 conn.commit()
                 return True
         except sqlite3.IntegrityError:
@@ -379,13 +753,7 @@ class ReviewRepository:
             cursor = conn.cursor()
             
             
-            order_by = {
-                "newest": "r.created_at DESC",
-                "oldest": "r.created_at ASC",
-                "highest": "r.rating DESC, r.created_at DESC",
-                "lowest": "r.rating ASC, r.created_at DESC",
-                "popular": "r.likes DESC, r.created_at DESC"
-            }.get(sort_by, "r.created_at DESC")
+            order_by = REVIEW_SORTS.get(sort_by, REVIEW_SORTS["newest"])[0]
             
             cursor.execute(f'''
                 SELECT r.id, r.user_id, u.username, r.rating, r.comment, 
@@ -408,87 +776,189 @@ class ReviewRepository:
             } for review in reviews]
 
     @staticmethod
-    def get_average_rating() -> float:
-        """Получить средний рейтинг"""
+    def get_reviews_feed(
+        user_id: int,
+        sort_by: str = "newest",
+        after: Optional[list] = None,
+        limit: int = -1
+    ) -> dict:
+        """Страница отзывов с флагом user_has_liked, средний рейтинг, количество и отзыв
+        самого пользователя — одним снимком базы и без запроса на каждый отзыв.
+
+        after — значения курсора (next_cursor предыдущей страницы), limit=-1 — без ограничения"""
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT AVG(rating) FROM reviews")
-            result = cursor.fetchone()
-            return round(result[0] or 0, 1)
+            # явная читающая транзакция: все выборки видят одно состояние базы
+            cursor.execute("BEGIN")
+            reviews, next_cursor = _select_reviews_page(cursor, sort_by, after, limit, user_id)
+            stats = _select_review_stats(cursor)
+            user_review = _select_user_review(cursor, user_id)
+            conn.commit()
+
+        return {
+            "reviews": reviews,
+            "average_rating": stats["average_rating"],
+            "reviews_count": stats["reviews_count"],
+            "rating_distribution": stats["rating_distribution"],
+            "user_review": user_review,
+            "next_cursor": next_cursor
+        }
+
+    @staticmethod
+    def get_reviews_page(
+        sort_by: str = "newest",
+        after: Optional[list] = None,
+        limit: int = -1
+    ) -> dict:
+        """Общая для всех пользователей часть ленты: страница отзывов без user_has_liked
+        и статистика, одним снимком базы"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN")
+            reviews, next_cursor = _select_reviews_page(cursor, sort_by, after, limit)
+            stats = _select_review_stats(cursor)
+            conn.commit()
+
+        return {
+            "reviews": reviews,
+            "average_rating": stats["average_rating"],
+            "reviews_count": stats["reviews_count"],
+            "rating_distribution": stats["rating_distribution"],
+            "next_cursor": next_cursor
+        }
+
+    @staticmethod
+    def get_liked_review_ids(user_id: int) -> Set[int]:
+        """id отзывов, которые лайкнул пользователь"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT review_id FROM review_likes WHERE user_id = ?", (user_id,))
+            return {row[0] for row in cursor.fetchall()}
+
+    @staticmethod
+    def get_review_stats() -> dict:
+        """Количество, средний рейтинг, распределение оценок и число лайков из review_stats"""
+        with get_db_connection() as conn:
+            return _select_review_stats(conn.cursor())
+
+    @staticmethod
+    def get_average_rating() -> float:
+        """Получить средний рейтинг"""
+        return ReviewRepository.get_review_stats()["average_rating"]
 
     @staticmethod
     def get_reviews_count() -> int:
         """Получить количество отзывов"""
+        return ReviewRepository.get_review_stats()["reviews_count"]
+
+    @staticmethod
+    @retry_on_locked
+    def rebuild_review_stats(check_only: bool = False, pending_likes: int = 0) -> dict:
+        """Сверяет review_stats с таблицами отзывов и, если check_only=False, пересчитывает.
+        pending_likes — ещё не сброшенные дельты лайков этого процесса (LikeCounterBuffer):
+        они уже есть в review_likes, а в total_likes попадут при сбросе.
+        Возвращает {"stored": ..., "actual": ..., "consistent": bool}"""
+        columns = ', '.join(REVIEW_STATS_COLUMNS)
         with get_db_connection() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT COUNT(*) FROM reviews")
-            return cursor.fetchone()[0]
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute(f"SELECT {columns} FROM review_stats WHERE id = 1")
+            stored = cursor.fetchone()
+            fill_review_stats(cursor)
+            if pending_likes:
+                _update_review_stats(cursor, likes=-pending_likes)
+            cursor.execute(f"SELECT {columns} FROM review_stats WHERE id = 1")
+            actual = cursor.fetchone()
+            if check_only:
+                conn.rollback()
+            else:
+                conn.commit()
+
+        return {
+            "stored": dict(zip(REVIEW_STATS_COLUMNS, stored)) if stored else None,
+            "actual": dict(zip(REVIEW_STATS_COLUMNS, actual)),
+            "consistent": stored == actual
+        }
 
     @staticmethod
+    @retry_on_locked
     def update_review(user_id: int, rating: int, comment: str) -> bool:
         """Обновить отзыв пользователя"""
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            # старая оценка читается под блокировкой записи, чтобы дельта статистики была точной
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT rating FROM reviews WHERE user_id = ?", (user_id,))
+            old = cursor.fetchone()
+            if not old:
+                conn.rollback()
+                return False
+
             cursor.execute('''
                 UPDATE reviews 
                 SET rating = ?, comment = ?, updated_at = CURRENT_TIMESTAMP 
                 WHERE user_id = ?
             ''', (rating, comment, user_id))
+            if old[0] != rating:
+                _update_review_stats(cursor, stars={old[0]: -1, rating: 1})
             conn.commit()
-            return cursor.rowcount > 0
+            return True
 
     @staticmethod
+    @retry_on_locked
     def delete_review(user_id: int) -> bool:
         """Удалить отзыв пользователя"""
         with get_db_connection() as conn:
             cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT rating FROM reviews WHERE user_id = ?", (user_id,))
+            review = cursor.fetchone()
+            if not review:
+                conn.rollback()
+                return False
             
             
             cursor.execute('''
                 DELETE FROM review_likes 
                 WHERE review_id IN (SELECT id FROM reviews WHERE user_id = ?)
             ''', (user_id,))
+            removed_likes = cursor.rowcount
             
             
             cursor.execute("DELETE FROM reviews WHERE user_id = ?", (user_id,))
+            _update_review_stats(cursor, count=-1, stars={review[0]: -1}, likes=-removed_likes)
             conn.commit()
-            return cursor.rowcount > 0
+            return True
 
     @staticmethod
-    def like_review(review_id: int, user_id: int) -> bool:
-        """Лайкнуть отзыв"""
-        try:
-            with get_db_connection() as conn:
-                cursor = conn.cursor()
-                
-                
-                cursor.execute(
-                    "SELECT id FROM review_likes WHERE review_id = ? AND user_id = ?",
-                    (review_id, user_id)
-                )
-                if cursor.fetchone():
-                    return False  
-                
-                
-                cursor.execute(
-                    "INSERT INTO review_likes (review_id, user_id) VALUES (?, ?)",
-                    (review_id, user_id)
-                )
-                
-                
+    @retry_on_locked
+    def like_review(review_id: int, user_id: int, update_counter: bool = True) -> bool:
+        """Лайкнуть отзыв. update_counter=False — reviews.likes и review_stats не меняются,
+        счётчик обновит пакетный сброс (reviews.service.LikeCounterBuffer)"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            # повторный лайк игнорируется UNIQUE(review_id, user_id), лайк несуществующего отзыва не пишется
+            cursor.execute('''
+                INSERT OR IGNORE INTO review_likes (review_id, user_id)
+                SELECT ?, ? WHERE EXISTS (SELECT 1 FROM reviews WHERE id = ?)
+            ''', (review_id, user_id, review_id))
+            if not cursor.rowcount:
+                return False
+
+            if update_counter:
                 cursor.execute(
                     "UPDATE reviews SET likes = likes + 1 WHERE id = ?",
                     (review_id,)
                 )
-                
-                conn.commit()
-                return True
-        except sqlite3.IntegrityError:
-            return False
+                _update_review_stats(cursor, likes=1)
+
+            conn.commit()
+            return True
 
     @staticmethod
-    def unlike_review(review_id: int, user_id: int) -> bool:
-        """Убрать лайк с отзыва"""
+    @retry_on_locked
+    def unlike_review(review_id: int, user_id: int, update_counter: bool = True) -> bool:
+        """Убрать лайк с отзыва. update_counter — как в like_review"""
         with get_db_connection() as conn:
             cursor = conn.cursor()
             
@@ -498,16 +968,81 @@ class ReviewRepository:
             )
             
             if cursor.rowcount > 0:
-                
-                cursor.execute(
-                    "UPDATE reviews SET likes = likes - 1 WHERE id = ?",
-                    (review_id,)
-                )
+                if update_counter:
+                    cursor.execute(
+                        "UPDATE reviews SET likes = likes - 1 WHERE id = ?",
+                        (review_id,)
+                    )
+                    if cursor.rowcount:
+                        _update_review_stats(cursor, likes=-1)
                 conn.commit()
                 return True
             
             return False
 
+    @staticmethod
+    @retry_on_locked
+    def apply_like_deltas(deltas: Dict[int, int]):
+        """Пакетно прибавляет накопленные изменения лайков {review_id: дельта}
+        к reviews.likes и review_stats одной транзакцией"""
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.executemany(
+                "UPDATE reviews SET likes = likes + ? WHERE id = ?",
+                [(delta, review_id) for review_id, delta in deltas.items() if delta]
+            )
+            # дельты удалённых отзывов тоже учитываются: delete_review уже вычел
+            # из total_likes все их строки review_likes, включая ещё не сброшенные
+            _update_review_stats(cursor, likes=sum(deltas.values()))
+            conn.commit()
+
+    @staticmethod
+    @retry_on_locked
+    def reconcile_like_counts(check_only: bool = False, pending: Optional[Dict[int, int]] = None) -> dict:
+        """Сверяет reviews.likes с числом строк review_likes и, если check_only=False,
+        исправляет расхождения и пересчитывает review_stats.
+        pending — ещё не сброшенные дельты {review_id: дельта} этого процесса: целевое
+        значение счётчика — COUNT(review_likes) минус дельта, которую добавит сброс.
+        Возвращает {"mismatched": [(review_id, было, стало), ...], "stats_consistent": bool}"""
+        pending = pending or {}
+        columns = ', '.join(REVIEW_STATS_COLUMNS)
+        with get_db_connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute('''
+                SELECT r.id, r.likes,
+                       (SELECT COUNT(*) FROM review_likes rl WHERE rl.review_id = r.id)
+                FROM reviews r
+            ''')
+            mismatched = []
+            for review_id, likes, count in cursor.fetchall():
+                target = count - pending.get(review_id, 0)
+                if likes != target:
+                    mismatched.append((review_id, likes, target))
+            cursor.executemany(
+                "UPDATE reviews SET likes = ? WHERE id = ?",
+                [(target, review_id) for review_id, _, target in mismatched]
+            )
+
+            cursor.execute(f"SELECT {columns} FROM review_stats WHERE id = 1")
+            stored = cursor.fetchone()
+            fill_review_stats(cursor)
+            # дельты удалённых отзывов тоже прибавятся к total_likes при сбросе (см. apply_like_deltas)
+            if pending:
+                _update_review_stats(cursor, likes=-sum(pending.values()))
+            cursor.execute(f"SELECT {columns} FROM review_stats WHERE id = 1")
+            actual = cursor.fetchone()
+            if check_only:
+                conn.rollback()
+            else:
+                conn.commit()
+
+        return {
+            "mismatched": mismatched,
+            "stats_consistent": stored == actual
+        }
+
     @staticmethod
     def has_user_liked(review_id: int, user_id: int) -> bool:
         """Проверить, лайкал ли пользователь отзыв"""
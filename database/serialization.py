@@ -0,0 +1,73 @@
+"""Кодирование результатов и прогресса квиза для хранения в users.db.
+
+Значения хранятся компактным JSON. Старые строки, записанные через
+str(dict), читаются безопасным ast.literal_eval вместо eval и
+переписываются миграцией 3.
+"""
+import ast
+import base64
+import binascii
+import json
+from typing import Any, Dict, Optional
+
+RESULT_TYPES = ("A", "B", "C", "D")
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+_decode = json.JSONDecoder().decode
+
+
+def encode_json(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    return _encoder.encode(value)
+
+
+def decode_json(raw: Optional[str]) -> Any:
+    if not raw:
+        return None
+    try:
+        return _decode(raw)
+    except ValueError:
+        return decode_legacy(raw)
+
+
+def decode_legacy(raw: str) -> Any:
+    """Строка в формате str(dict) от старых версий приложения"""
+    try:
+        return ast.literal_eval(raw)
+    except (ValueError, SyntaxError):
+        return None
+
+
+def normalize_results(results: Optional[dict]) -> Dict[str, int]:
+    results = results or {}
+    return {key: int(results.get(key, 0) or 0) for key in RESULT_TYPES}
+
+
+def encode_results(results: dict) -> str:
+    return encode_json(normalize_results(results))
+
+
+def decode_results(raw: Optional[str]) -> Optional[Dict[str, int]]:
+    value = decode_json(raw)
+    if not isinstance(value, dict):
+        return None
+    return normalize_results(value)
+
+
+def encode_cursor(values: list) -> str:
+    """Непрозрачный курсор постраничной выдачи: значения ключа сортировки последней строки"""
+    return base64.urlsafe_b64encode(_encoder.encode(values).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        values = _decode(base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8"))
+    except (ValueError, UnicodeError, binascii.Error):
+        raise ValueError("Некорректный курсор")
+    # значения ключа сортировки — числа и строки; прочее (списки, объекты) в курсоре не бывает
+    if not isinstance(values, list) or not all(
+        isinstance(value, (int, str)) and not isinstance(value, bool) for value in values
+    ):
+        raise ValueError("Некорректный курсор")
+    return values
@@ -1,12 +1,15 @@
 from fastapi import FastAPI, Request
-from database.connection import init_db
+from database.connection import init_db, close_pool, start_checkpointer
 from auth.router import router as auth_router
 from quiz.router import router as quiz_router
-from chat.router import router as chat_router
+from chat.router import router as chat_router, chat_bot
 from results.router import router as results_router
 from reviews.router import router as reviews_router
+from quiz.service import progress_buffer
+from reviews.service import like_buffer
+from results.service import ResultsService
 from fastapi.middleware.cors import CORSMiddleware
-from config import STATIC_DIR, IMAGES_DIR
+from config import STATIC_DIR, IMAGES_DIR, CHART_CACHE_WARMUP
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
@@ -28,6 +31,25 @@ templates = Jinja2Templates(directory="templates")
 init_db()
 
 
+@app.on_event("startup")
+def start_background_tasks():
+    start_checkpointer()
+    progress_buffer.start()
+    like_buffer.start()
+    chat_bot.start()
+    ResultsService.prepare_chart_names()
+    if CHART_CACHE_WARMUP:
+        ResultsService.start_chart_warmup()
+
+
+@app.on_event("shutdown")
+def stop_background_tasks():
+    progress_buffer.stop()
+    like_buffer.stop()
+    ResultsService.shutdown()
+    close_pool()
+
+
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 app.mount("/img", StaticFiles(directory=IMAGES_DIR), name="images")
 
@@ -1,7 +1,28 @@
 from pydantic import BaseModel
+from typing import Dict, List, Optional
 
 class QuizResults(BaseModel):
     A: int
     B: int
     C: int
-    D: int
\ No newline at end of file
+    D: int
+
+class QuizOption(BaseModel):
+    text: str
+    # обычный вариант относится к одному типу; weights позволяет задать
+    # вес или несколько типов сразу, например {"A": 1, "C": 1}
+    type: Optional[str] = None
+    weights: Dict[str, int] = {}
+
+    def type_weights(self) -> Dict[str, int]:
+        if self.weights:
+            return self.weights
+        return {self.type: 1} if self.type else {}
+
+class QuizQuestion(BaseModel):
+    question: str
+    options: List[QuizOption]
+
+class QuizDefinition(BaseModel):
+    types: List[str] = ["A", "B", "C", "D"]
+    questions: List[QuizQuestion]
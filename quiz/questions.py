@@ -0,0 +1,188 @@
+from quiz.models import QuizDefinition
+
+# Вопросы опросника. Порядок вопросов и вариантов важен: в базе ответы
+# хранятся как индексы выбранных вариантов.
+QUESTIONS = [
+    {
+        "question": "Что тебе интереснее делать в компании?",
+        "options": [
+            {"text": "Организовать игру или активность.", "type": "A"},
+            {"text": "Знакомить людей, поддерживать беседу.", "type": "B"},
+            {"text": "Придумывать общую идею для мероприятия.", "type": "C"},
+            {"text": "Распределять задачи и следить за временем.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Какой отдых для тебя идеален?",
+        "options": [
+            {"text": "Поход с палаткой, спортивный забег.", "type": "A"},
+            {"text": "Большая вечеринка или посиделки с друзьями.", "type": "B"},
+            {"text": "Мастер-класс по рисованию или музыкальный концерт.", "type": "C"},
+            {"text": "Спокойный вечер за планированием будущей поездки.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Твой подход к решению проблемы?",
+        "options": [
+            {"text": "Сразу пробую разные способы на практике.", "type": "A"},
+            {"text": "Обсуждаю с кем-то, чтобы найти решение вместе.", "type": "B"},
+            {"text": "Ищу необычный, творческий способ.", "type": "C"},
+            {"text": "Составляю план действий и анализирую возможные результаты.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Какую книгу или фильм ты выберешь?",
+        "options": [
+            {"text": "Приключения, спорт, документалистика о природе.", "type": "A"},
+            {"text": "Драма, романтика, история отношений между персонажами.", "type": "B"},
+            {"text": "Фэнтези, научная фантастика, арт-хаус.", "type": "C"},
+            {"text": "Детектив, бизнес-литература, историческая хроника.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Что важнее в работе?",
+        "options": [
+            {"text": "Видеть реальный, осязаемый результат своего труда.", "type": "A"},
+            {"text": "Помогать другим, общаться, работать в команде.", "type": "B"},
+            {"text": "Иметь свободу для самовыражения и творчества.", "type": "C"},
+            {"text": "Четкая структура, понятные задачи и карьерный рост.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Если бы ты получил(-а) большую сумму денег, что сделал(-а) бы в первую очередь?",
+        "options": [
+            {"text": "Купил(-а) что-то для хобби (велосипед, гитару) или поехал(-а) в активный тур.", "type": "A"},
+            {"text": "Устроил(-а) грандиозную вечеринку для всех друзей.", "type": "B"},
+            {"text": "Вложил(-а) в свое образование или творческий проект.", "type": "C"},
+            {"text": "Открыл(-а) вклад в банке или составил(-а) финансовый план.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Как ты учишься чему-то новому?",
+        "options": [
+            {"text": "Сразу пробую делать, учусь на своих ошибках.", "type": "A"},
+            {"text": "Записываюсь на курсы в группе, чтобы было веселее.", "type": "B"},
+            {"text": "Ищу нестандартные подходы, экспериментирую.", "type": "C"},
+            {"text": "Внимательно читаю инструкцию, составляю конспект.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Что тебя мотивирует?",
+        "options": [
+            {"text": "Соревновательный дух, желание быть первым.", "type": "A"},
+            {"text": "Признание и благодарность от других людей.", "type": "B"},
+            {"text": "Возможность создать что-то уникальное.", "type": "C"},
+            {"text": "Четко поставленная цель и план по ее достижению.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Твои сильные стороны в учебе?",
+        "options": [
+            {"text": "Лабораторные работы, физкультура, черчение.", "type": "A"},
+            {"text": "Подготовка презентаций, групповые проекты, дебаты.", "type": "B"},
+            {"text": "Сочинения, проекты по искусству, нестандартные задачи.", "type": "C"},
+            {"text": "Решение задач по алгоритму, подготовка к тестам.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Как ты относишься к правилам?",
+        "options": [
+            {"text": "Считаю их нужными, но люблю проверять их на прочность.", "type": "A"},
+            {"text": "Правила важны для комфортного общения.", "type": "B"},
+            {"text": "Часто вижу, как их можно улучшить или нарушить ради идеи.", "type": "C"},
+            {"text": "Правила созданы для того, чтобы их соблюдать. Это основа порядка.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Что тебе интереснее в новостях?",
+        "options": [
+            {"text": "Новости спорта, технологий, происшествия.", "type": "A"},
+            {"text": "Светская хроника, истории о людях.", "type": "B"},
+            {"text": "Анонсы культурных событий, новые фильмы и музыка.", "type": "C"},
+            {"text": "Аналитика экономики и политики.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Твоя роль в групповом проекте?",
+        "options": [
+            {"text": "Тот, кто делает самую сложную практическую часть.", "type": "A"},
+            {"text": "Координатор общения, который всех объединяет.", "type": "B"},
+            {"text": "Генератор идей и дизайнер.", "type": "C"},
+            {"text": "Составитель плана и ответственный за сроки.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Что для тебя важнее в общении?",
+        "options": [
+            {"text": "Делать что-то вместе, а не много говорить.", "type": "A"},
+            {"text": "Получать эмоциональный отклик и поддержку.", "type": "B"},
+            {"text": "Обмениваться креативными идеями и вдохновлять.", "type": "C"},
+            {"text": "Обсуждать факты и приходить к логичному выводу.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Как ты справляешься со стрессом?",
+        "options": [
+            {"text": "Иду на пробежку или в спортзал.", "type": "A"},
+            {"text": "Встречаюсь с друзьями и рассказываю им о проблеме.", "type": "B"},
+            {"text": "Занимаюсь творчеством (музыка, рисование, письмо).", "type": "C"},
+            {"text": "Составляю подробный план действий.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Какой гаджет тебе ближе?",
+        "options": [
+            {"text": "Фитнес-трекер или мощный инструмент (дрель, мясорубка).", "type": "A"},
+            {"text": "Качественная камера для селфи и видео-звонков.", "type": "B"},
+            {"text": "Графический планшет или мощный компьютер для творчества.", "type": "C"},
+            {"text": "Органайзер или приложение для учета финансов.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Что бы ты хотел(-а) улучшить в мире?",
+        "options": [
+            {"text": "Создать более прочные и удобные вещи.", "type": "A"},
+            {"text": "Научить людей лучше понимать друг друга.", "type": "B"},
+            {"text": "Сделать мир красивее и вдохновляющее.", "type": "C"},
+            {"text": "Сделать системы управления более эффективными.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Каким был твой любимый предмет в школе?",
+        "options": [
+            {"text": "Физкультура, труд, черчение.", "type": "A"},
+            {"text": "Литература, история, обществознание.", "type": "B"},
+            {"text": "Музыка, ИЗО, информатика.", "type": "C"},
+            {"text": "Математика, физика, экономика.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Кем ты был(-а) в школьные годы в группе друзей?",
+        "options": [
+            {"text": "Инициатором подвижных игр.", "type": "A"},
+            {"text": "Душой компании, тем, кто всех мирит.", "type": "B"},
+            {"text": "Самым необычным, выдумщиком.", "type": "C"},
+            {"text": "Голосом разума, кто всегда помнит о дедлайнах.", "type": "D"},
+        ],
+    },
+    {
+        "question": "Что для тебя значит \"успех\"?",
+        "options": [
+            {"text": "Побить свой рекорд, достичь мастерства в деле.", "type": "A"},
+            {"text": "Быть окруженным верными друзьями и семьей.", "type": "B"},
+            {"text": "Реализовать свой уникальный творческий замысел.", "type": "C"},
+            {"text": "Построить надежную и стабильную жизнь.", "type": "D"},
+        ],
+    },
+    {
+        "question": "На что ты обращаешь внимание в первую очередь, знакомясь с новым человеком?",
+        "options": [
+            {"text": "На его активность, энергию, осанку.", "type": "A"},
+            {"text": "На его манеру общения, чувство юмора, открытость.", "type": "B"},
+            {"text": "На его стиль, необычные детали, творческий подход.", "type": "C"},
+            {"text": "На его логику, грамотность речи, умение аргументировать.", "type": "D"},
+        ],
+    },
+]
+
+QUIZ = QuizDefinition(questions=QUESTIONS)
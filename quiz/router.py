@@ -1,9 +1,11 @@
+import asyncio
 from fastapi import APIRouter, Request, Depends, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
 from fastapi.templating import Jinja2Templates
-from auth.dependencies import get_current_user
+from auth.dependencies import get_current_user, get_request_json
 from quiz.service import QuizService
 from quiz.models import QuizResults
+from database.serialization import encode_json
 from config import TEMPLATES_DIR, STATIC_DIR
 from fastapi.staticfiles import StaticFiles
 
@@ -31,7 +33,8 @@ def questions_page(request: Request, user_id: int = Depends(get_current_user)):
         "user_id": user_id,
         "saved_answers": saved_answers,
         "saved_results": saved_results,
-        "current_question": current_question
+        "current_question": current_question,
+        "quiz_json": QuizService.get_quiz_json()
     })
 
 @router.post('/process_results')
@@ -40,21 +43,22 @@ async def process_results(
     user_id: int = Depends(get_current_user)
 ):
     try:
-        body = await request.json()
+        body = await get_request_json(request)
+        if not isinstance(body, dict):
+            raise ValueError("Invalid JSON body")
         
-        results = QuizResults(
-            A=body.get('A', 0),
-            B=body.get('B', 0),
-            C=body.get('C', 0),
-            D=body.get('D', 0)
-        )
+        # счетчики типов считаются на сервере по индексам выбранных вариантов
+        answers = QuizService.parse_answers(body.get('answers'), complete=True)
+        results = QuizResults(**QuizService.score_answers(answers))
 
-        answers_string = f"A:{results.A},B:{results.B},C:{results.C},D:{results.D}"
-        QuizService.save_user_answers(user_id, answers_string, results.dict())
-        QuizService.clear_quiz_progress(user_id)
+        QuizService.save_user_answers(user_id, encode_json(answers), results.dict())
+        # clear ждет идущего сброса буфера прогресса — не в event loop
+        await asyncio.to_thread(QuizService.clear_quiz_progress, user_id)
 
         return {"status": "success", "results": results.dict()}
 
+    except ValueError as e:
+        return JSONResponse({"status": "error", "error": str(e)}, status_code=400)
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
@@ -169,14 +173,19 @@ async def save_quiz_progress_endpoint(
     user_id: int = Depends(get_current_user)
 ):
     try:
-        body = await request.json()
+        body = await get_request_json(request)
+        if not isinstance(body, dict):
+            raise ValueError("Invalid JSON body")
+        answers = QuizService.parse_answers(body.get('answers', []))
         QuizService.save_quiz_progress(
             user_id=user_id,
-            current_question=body.get('current_question', 0),
-            answers=body.get('answers', {}),
-            results=body.get('results')
+            current_question=QuizService.parse_current_question(body.get('current_question', 0)),
+            answers=answers,
+            results=QuizService.score_answers(answers)
         )
         return {"status": "success"}
+    except ValueError as e:
+        return JSONResponse({"status": "error", "error": str(e)}, status_code=400)
     except Exception as e:
         return {"status": "error", "error": str(e)}
 
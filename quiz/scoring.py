@@ -0,0 +1,91 @@
+from typing import Dict, Iterable, List, Optional, Sequence
+from quiz.models import QuizDefinition
+
+
+class ScoringEngine:
+    """Подсчет типов по индексам выбранных вариантов.
+
+    Веса всех вариантов разворачиваются в плоскую таблицу один раз при
+    создании движка, поэтому подсчет — это поиск строки по смещению
+    вопроса и индексу варианта и сложение векторов весов.
+    """
+
+    def __init__(self, quiz: QuizDefinition):
+        self.types = tuple(quiz.types)
+        self.question_count = len(quiz.questions)
+        self._offsets: List[int] = []
+        self._option_counts: List[int] = []
+        self._rows: List[tuple] = []
+
+        for question in quiz.questions:
+            self._offsets.append(len(self._rows))
+            self._option_counts.append(len(question.options))
+            for option in question.options:
+                weights = option.type_weights()
+                unknown = set(weights) - set(self.types)
+                if unknown:
+                    raise ValueError(f"Unknown quiz types {sorted(unknown)} in {option.text!r}")
+                self._rows.append(tuple(weights.get(t, 0) for t in self.types))
+
+        self._zero = (0,) * len(self.types)
+        self._reachable = None
+        # верхняя граница любого счетчика: во всех вопросах выбран самый "тяжелый" вариант
+        self.max_total = sum(
+            max((max(row) for row in self._rows[offset:offset + count]), default=0)
+            for offset, count in zip(self._offsets, self._option_counts)
+        )
+
+    def _row_indexes(self, answers: Sequence[Optional[int]]) -> List[int]:
+        if len(answers) > self.question_count:
+            raise ValueError(f"Expected at most {self.question_count} answers, got {len(answers)}")
+
+        indexes = []
+        for question, option in enumerate(answers):
+            if option is None:
+                continue
+            if isinstance(option, bool) or not isinstance(option, int) \
+                    or not 0 <= option < self._option_counts[question]:
+                raise ValueError(f"Invalid answer {option!r} for question {question + 1}")
+            indexes.append(self._offsets[question] + option)
+        return indexes
+
+    def score_vector(self, answers: Sequence[Optional[int]]) -> tuple:
+        rows = self._rows
+        selected = [rows[i] for i in self._row_indexes(answers)]
+        if not selected:
+            return self._zero
+        return tuple(map(sum, zip(*selected)))
+
+    def score(self, answers: Sequence[Optional[int]]) -> Dict[str, int]:
+        return dict(zip(self.types, self.score_vector(answers)))
+
+    def score_many(self, answer_sets: Iterable[Sequence[Optional[int]]]) -> List[Dict[str, int]]:
+        """Пересчет большого числа сохраненных наборов ответов за один вызов"""
+        types = self.types
+        score_vector = self.score_vector
+        return [dict(zip(types, score_vector(answers))) for answers in answer_sets]
+
+    def reachable_scores(self, allow_skipped: bool = False) -> List[tuple]:
+        """Все векторы счетчиков, которые дает полностью пройденный опросник.
+        allow_skipped — также с пропущенными вопросами (ответ None)"""
+        scores = {self._zero}
+        for offset, count in zip(self._offsets, self._option_counts):
+            rows = self._rows[offset:offset + count]
+            if allow_skipped:
+                rows = rows + [self._zero]
+            scores = {
+                tuple(a + b for a, b in zip(score, row))
+                for score in scores
+                for row in rows
+            }
+        return sorted(scores)
+
+    def reachable_set(self) -> frozenset:
+        """reachable_scores(allow_skipped=True), посчитанные один раз"""
+        if self._reachable is None:
+            self._reachable = frozenset(self.reachable_scores(allow_skipped=True))
+        return self._reachable
+
+    def is_reachable(self, counts: tuple) -> bool:
+        """Может ли опросник (в том числе с пропущенными вопросами) дать такие счетчики"""
+        return counts in self.reachable_set()
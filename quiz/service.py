@@ -1,26 +1,215 @@
+import json
+import threading
+from functools import lru_cache
 from database.repositories import QuizRepository
-from typing import Dict, Any, Optional
+from database.serialization import decode_json, decode_results
+from quiz.questions import QUIZ
+from quiz.scoring import ScoringEngine
+from config import PROGRESS_FLUSH_INTERVAL
+from typing import Dict, Any, List, Optional
+
+
+class ProgressBuffer:
+    """Буфер отложенной записи прогресса квиза.
+
+    Хранит последний прогресс каждого пользователя в памяти и сбрасывает
+    накопленное в SQLite одной транзакцией раз в flush_interval секунд,
+    вместо INSERT OR REPLACE на каждый ответ. Буфер локален для процесса.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._pending: Dict[int, Dict[str, Any]] = {}
+        # прогресс, забранный текущим сбросом: виден в get(), пока запись не закоммичена
+        self._flushing: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        # удерживается на время записи в базу, чтобы clear() не разминулся
+        # с уже забранным из буфера, но еще не записанным прогрессом
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.stats = {"buffered_writes": 0, "flushes": 0, "flushed_rows": 0, "flush_errors": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.flush_interval > 0
+
+    def put(self, user_id: int, current_question: int, answers: dict, results: dict = None):
+        with self._lock:
+            self._pending[user_id] = {
+                "current_question": current_question,
+                "answers": answers or {},
+                "results": results or None,
+            }
+            self.stats["buffered_writes"] += 1
+
+    def get(self, user_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            progress = self._pending.get(user_id)
+            if progress is None:
+                progress = self._flushing.get(user_id)
+            return progress
+
+    def clear(self, user_id: int):
+        with self._flush_lock:
+            with self._lock:
+                self._pending.pop(user_id, None)
+            QuizRepository.clear_quiz_progress(user_id)
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                self._flushing = pending
+            if not pending:
+                return 0
+
+            try:
+                QuizRepository.save_quiz_progress_many([
+                    (user_id, p["current_question"], p["answers"], p["results"])
+                    for user_id, p in pending.items()
+                ])
+            except Exception as e:
+                print(f"Ошибка сохранения прогресса: {e}")
+                with self._lock:
+                    self.stats["flush_errors"] += 1
+                    # более свежий прогресс, пришедший во время записи, важнее
+                    for user_id, progress in pending.items():
+                        self._pending.setdefault(user_id, progress)
+                    self._flushing = {}
+                raise
+
+            with self._lock:
+                self._flushing = {}
+                self.stats["flushes"] += 1
+                self.stats["flushed_rows"] += len(pending)
+            return len(pending)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                pass
+
+    def start(self):
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="quiz-progress-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception:
+            # ошибка уже в логе; остановка приложения не должна прерываться
+            print(f"Прогресс квиза не сохранен при остановке: {len(self._pending)} пользователей")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["pending"] = len(self._pending)
+        stats["flush_interval"] = self.flush_interval
+        return stats
+
+
+progress_buffer = ProgressBuffer(PROGRESS_FLUSH_INTERVAL)
+scoring_engine = ScoringEngine(QUIZ)
+
 
 class QuizService:
     @staticmethod
     def save_quiz_progress(user_id: int, current_question: int, answers: dict, results: dict = None):
-        QuizRepository.save_quiz_progress(user_id, current_question, answers, results)
+        if progress_buffer.enabled:
+            progress_buffer.put(user_id, current_question, answers, results)
+        else:
+            QuizRepository.save_quiz_progress(user_id, current_question, answers, results)
 
     @staticmethod
     def get_quiz_progress(user_id: int) -> Optional[Dict[str, Any]]:
+        progress = progress_buffer.get(user_id)
+        if progress is not None:
+            return progress
         return QuizRepository.get_quiz_progress(user_id)
 
     @staticmethod
     def clear_quiz_progress(user_id: int):
-        QuizRepository.clear_quiz_progress(user_id)
+        progress_buffer.clear(user_id)
 
     @staticmethod
     def save_user_answers(user_id: int, answers: str, results: dict):
         QuizRepository.save_answers(user_id, answers, results)
 
+    @staticmethod
+    @lru_cache(maxsize=1)
+    def get_quiz_json() -> str:
+        """Определение опросника для встраивания в questions.html"""
+        quiz = {
+            "types": QUIZ.types,
+            "questions": [
+                {
+                    "question": q.question,
+                    "options": [{"text": o.text} for o in q.options],
+                }
+                for q in QUIZ.questions
+            ],
+        }
+        # "</" внутри <script> закрыл бы тег раньше времени
+        return json.dumps(quiz, ensure_ascii=False).replace("</", "<\\/")
+
+    @staticmethod
+    def parse_answers(answers: Any, complete: bool = False) -> List[Optional[int]]:
+        """Ответы квиза; complete=True — итоговая отправка, нужен ответ на каждый вопрос"""
+        if not isinstance(answers, list):
+            raise ValueError("answers must be a list of option indexes")
+        question_count = scoring_engine.question_count
+        if complete and (len(answers) != question_count or any(option is None for option in answers)):
+            raise ValueError(f"Expected answers to all {question_count} questions")
+        # проверяет длину и индексы вариантов
+        scoring_engine.score_vector(answers)
+        return answers
+
+    @staticmethod
+    def parse_current_question(current_question: Any) -> int:
+        question_count = scoring_engine.question_count
+        if isinstance(current_question, bool) or not isinstance(current_question, int) \
+                or not 0 <= current_question <= question_count:
+            raise ValueError(f"current_question must be an integer from 0 to {question_count}")
+        return current_question
+
+    @staticmethod
+    def score_answers(answers: List[Optional[int]]) -> Dict[str, int]:
+        return scoring_engine.score(answers)
+
+    @staticmethod
+    def rescore_stored_results() -> int:
+        """Пересчитать все сохраненные результаты по текущему опроснику.
+
+        Нужен после изменения вопросов или весов. Старые записи, где
+        сохранены только итоговые счетчики, пропускаются.
+        """
+        ids, answer_sets = [], []
+        for answer_id, raw in QuizRepository.get_all_answers():
+            answers = decode_json(raw) if raw and raw.startswith("[") else None
+            try:
+                QuizService.parse_answers(answers)
+            except ValueError:
+                continue
+            ids.append(answer_id)
+            answer_sets.append(answers)
+
+        results = scoring_engine.score_many(answer_sets)
+        QuizRepository.update_results_many(list(zip(ids, results)))
+        return len(ids)
+
     @staticmethod
     def get_user_answers(user_id: int):
         result = QuizRepository.get_latest_results(user_id)
         if result:
-            return result[0], eval(result[1])
-        return None, None
\ No newline at end of file
+            return result[0], decode_results(result[1])
+        return None, None
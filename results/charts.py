@@ -0,0 +1,159 @@
+"""Отрисовка графика результатов опросника.
+
+По умолчанию график строится как SVG без сторонних зависимостей.
+matplotlib нужен только для PNG и импортируется при первом использовании.
+"""
+import io
+import threading
+import time
+from typing import Sequence
+from xml.sax.saxutils import escape
+
+TYPES = ['A', 'B', 'C', 'D']
+COLORS = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4']
+TITLE = 'Результаты опросника'
+X_LABEL = 'Типы личности'
+Y_LABEL = 'Количество ответов'
+
+MIME_TYPES = {
+    "svg": "image/svg+xml",
+    "png": "image/png",
+}
+
+# pyplot хранит глобальное состояние и не потокобезопасен
+_render_lock = threading.Lock()
+
+# размеры совпадают с PNG: figsize=(10, 6) при dpi=100
+_WIDTH, _HEIGHT = 1000, 600
+_PLOT_LEFT, _PLOT_RIGHT = 100, 970
+_PLOT_TOP, _PLOT_BOTTOM = 90, 520
+_FONT = "DejaVu Sans, Arial, Helvetica, sans-serif"
+
+
+def _y_ticks(y_max: int) -> list:
+    for step in (1, 2, 5, 10, 20, 50, 100):
+        if y_max / step <= 10:
+            break
+    return list(range(0, y_max + 1, step))
+
+
+def _fmt(value: float) -> str:
+    return f"{value:.1f}".rstrip("0").rstrip(".")
+
+
+def render_svg(counts: Sequence[int]) -> bytes:
+    counts = list(counts)
+    y_max = max(counts) + 2
+    plot_w = _PLOT_RIGHT - _PLOT_LEFT
+    plot_h = _PLOT_BOTTOM - _PLOT_TOP
+    slot = plot_w / len(TYPES)
+    bar_w = slot * 0.8
+
+    def y(value: float) -> float:
+        return _PLOT_BOTTOM - value / y_max * plot_h
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{_WIDTH}" height="{_HEIGHT}" '
+        f'viewBox="0 0 {_WIDTH} {_HEIGHT}" font-family="{_FONT}">',
+        f'<rect width="{_WIDTH}" height="{_HEIGHT}" fill="#ffffff"/>',
+        f'<text x="{_fmt((_PLOT_LEFT + _PLOT_RIGHT) / 2)}" y="45" text-anchor="middle" '
+        f'font-size="22" font-weight="bold">{escape(TITLE)}</text>',
+    ]
+
+    for tick in _y_ticks(y_max):
+        ty = _fmt(y(tick))
+        parts.append(
+            f'<line x1="{_PLOT_LEFT}" y1="{ty}" x2="{_PLOT_RIGHT}" y2="{ty}" '
+            f'stroke="#b0b0b0" stroke-opacity="0.3" stroke-dasharray="6 4"/>'
+        )
+        parts.append(
+            f'<text x="{_PLOT_LEFT - 10}" y="{ty}" text-anchor="end" '
+            f'dominant-baseline="middle" font-size="14">{tick}</text>'
+        )
+
+    for i, (label, count, color) in enumerate(zip(TYPES, counts, COLORS)):
+        center = _PLOT_LEFT + slot * (i + 0.5)
+        top = y(count)
+        parts.append(
+            f'<rect x="{_fmt(center - bar_w / 2)}" y="{_fmt(top)}" width="{_fmt(bar_w)}" '
+            f'height="{_fmt(_PLOT_BOTTOM - top)}" fill="{color}" fill-opacity="0.8" '
+            f'stroke="#000000" stroke-width="2"/>'
+        )
+        parts.append(
+            f'<text x="{_fmt(center)}" y="{_fmt(y(count + 0.1) - 4)}" text-anchor="middle" '
+            f'font-size="19" font-weight="bold">{count}</text>'
+        )
+        parts.append(
+            f'<text x="{_fmt(center)}" y="{_PLOT_BOTTOM + 24}" text-anchor="middle" '
+            f'font-size="14">{label}</text>'
+        )
+
+    parts.append(
+        f'<text x="{_fmt((_PLOT_LEFT + _PLOT_RIGHT) / 2)}" y="{_PLOT_BOTTOM + 60}" '
+        f'text-anchor="middle" font-size="17" font-weight="bold">{escape(X_LABEL)}</text>'
+    )
+    label_y = _fmt((_PLOT_TOP + _PLOT_BOTTOM) / 2)
+    parts.append(
+        f'<text x="40" y="{label_y}" text-anchor="middle" font-size="17" font-weight="bold" '
+        f'transform="rotate(-90 40 {label_y})">{escape(Y_LABEL)}</text>'
+    )
+    parts.append('</svg>')
+    return "".join(parts).encode("utf-8")
+
+
+def render_png(counts: Sequence[int]) -> bytes:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    with _render_lock:
+        plt.style.use('default')
+        fig, ax = plt.subplots(figsize=(10, 6))
+
+        counts = list(counts)
+
+        bars = ax.bar(TYPES, counts, color=COLORS,
+                      edgecolor='black', linewidth=2, alpha=0.8)
+
+        for bar, count in zip(bars, counts):
+            height = bar.get_height()
+            ax.text(bar.get_x() + bar.get_width()/2., height + 0.1,
+                    f'{count}', ha='center', va='bottom', fontsize=14, fontweight='bold')
+
+        ax.set_ylabel(Y_LABEL, fontsize=12, fontweight='bold')
+        ax.set_xlabel(X_LABEL, fontsize=12, fontweight='bold')
+        ax.set_title(TITLE, fontsize=16, fontweight='bold', pad=20)
+        ax.set_ylim(0, max(counts) + 2)
+
+        ax.grid(axis='y', alpha=0.3, linestyle='--')
+        ax.set_axisbelow(True)
+
+        for spine in ax.spines.values():
+            spine.set_visible(False)
+
+        buf = io.BytesIO()
+        plt.savefig(buf, format='png', dpi=100, bbox_inches='tight',
+                    facecolor='white', edgecolor='none')
+        plt.close(fig)
+        return buf.getvalue()
+
+
+def png_available() -> bool:
+    try:
+        import matplotlib  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+RENDERERS = {
+    "svg": render_svg,
+    "png": render_png,
+}
+
+
+def render_timed(fmt: str, counts: Sequence[int]) -> tuple:
+    """Отрисовка с замером времени; выполняется в процессе из пула рендера"""
+    started = time.perf_counter()
+    image = RENDERERS[fmt](counts)
+    return image, (time.perf_counter() - started) * 1000
@@ -1,9 +1,13 @@
-from fastapi import APIRouter, Request, Depends
-from fastapi.responses import HTMLResponse
+from fastapi import APIRouter, Request, Depends, HTTPException
+from fastapi.responses import HTMLResponse, Response
 from fastapi.templating import Jinja2Templates
 from auth.dependencies import get_current_user
-from results.service import ResultsService
+from results.service import ResultsService, ChartRenderQueueFull
+from results.charts import MIME_TYPES
 from database.repositories import UserRepository, SessionRepository
+from database.connection import get_pool_stats, get_storage_stats
+from quiz.service import progress_buffer
+from reviews.service import ReviewService
 from config import TEMPLATES_DIR, STATIC_DIR
 from fastapi.staticfiles import StaticFiles
 
@@ -32,6 +36,30 @@ async def get_user_results(
     except Exception as e:
         return {"error": str(e)}
 
+@router.get('/results/chart/{chart_name}')
+async def get_results_chart(request: Request, chart_name: str):
+    parsed = ResultsService.parse_chart_name(chart_name)
+    if not parsed:
+        raise HTTPException(status_code=404, detail="Chart not found")
+    fmt, counts, digest = parsed
+
+    # адрес содержит хэш содержимого, поэтому ответ можно кэшировать навсегда
+    headers = {
+        "ETag": f'"{digest}"',
+        "Cache-Control": "public, max-age=31536000, immutable",
+    }
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match.strip() == "*" or headers["ETag"] in [
+        tag.strip().removeprefix("W/") for tag in if_none_match.split(",")
+    ]:
+        return Response(status_code=304, headers=headers)
+
+    try:
+        image = await ResultsService.get_chart_async(counts, fmt)
+    except ChartRenderQueueFull:
+        raise HTTPException(status_code=503, detail="Chart rendering is busy, try again later")
+    return Response(content=image, media_type=MIME_TYPES[fmt], headers=headers)
+
 @router.get('/all', response_class=HTMLResponse)
 def all_types_page(request: Request, user_id: int = Depends(get_current_user)):
     return templates.TemplateResponse("all.html", {
@@ -52,5 +80,20 @@ def get_sessions():
     try:
         sessions = SessionRepository.get_all_sessions()
         return {"sessions": [{"id": s[0], "user_id": s[1], "ip_address": s[2], "created_at": s[3]} for s in sessions]}
+    except Exception as e:
+        return {"error": str(e)}
+
+@router.get('/get_db_stats')
+def get_db_stats():
+    try:
+        return {
+            "pool": get_pool_stats(),
+            "storage": get_storage_stats(),
+            "session_cache": SessionRepository.get_cache_stats(),
+            "progress_buffer": progress_buffer.get_stats(),
+            "chart_cache": ResultsService.get_chart_cache_stats(),
+            "review_feed_cache": ReviewService.get_cache_stats(),
+            "like_buffer": ReviewService.get_like_buffer_stats()
+        }
     except Exception as e:
         return {"error": str(e)}
\ No newline at end of file
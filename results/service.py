@@ -1,57 +1,380 @@
-import matplotlib.pyplot as plt
-import io
-import base64
+import asyncio
+import hashlib
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import Dict, Optional
+from cache import TTLCache
+from config import (
+    CHART_CACHE_SIZE,
+    CHART_CACHE_DIR,
+    CHART_FORMAT,
+    CHART_RENDER_WORKERS,
+    CHART_RENDER_MAX_PENDING,
+)
 from database.repositories import QuizRepository
+from database.serialization import RESULT_TYPES, decode_results
+from quiz.service import scoring_engine
+from results import charts
 
 # для вывода графика результата в сайте
 
+# увеличить при изменении внешнего вида графика, чтобы не отдавать старые файлы с диска
+CHART_VERSION = 1
+
+
+class ChartCache:
+    """Кэш графиков по формату и кортежу (A, B, C, D): LRU в памяти и файлы на диске.
+
+    Набор возможных графиков небольшой (счетчики ограничены числом вопросов),
+    поэтому каждый из них достаточно отрисовать один раз.
+    """
+
+    def __init__(self, maxsize: int, cache_dir: Optional[Path]):
+        self.memory = TTLCache(maxsize=maxsize)
+        self.cache_dir = Path(cache_dir) if cache_dir else None
+        self._lock = threading.Lock()
+        self.stats = {"disk_hits": 0, "disk_errors": 0}
+
+    def _path(self, key: tuple) -> Path:
+        fmt, counts = key
+        name = "_".join(str(count) for count in counts)
+        return self.cache_dir / f"v{CHART_VERSION}_{name}.{fmt}"
+
+    def _read_disk(self, key: tuple) -> Optional[bytes]:
+        if self.cache_dir is None:
+            return None
+        try:
+            return self._path(key).read_bytes()
+        except FileNotFoundError:
+            return None
+        except OSError:
+            self._count("disk_errors")
+            return None
+
+    def _write_disk(self, key: tuple, image: bytes):
+        if self.cache_dir is None:
+            return
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path.write_bytes(image)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            self._count("disk_errors")
+            print(f"Не удалось сохранить график на диск: {e}")
+
+    def _count(self, name: str, amount=1):
+        with self._lock:
+            self.stats[name] += amount
+
+    def lookup(self, fmt: str, counts: tuple) -> Optional[bytes]:
+        image = self.memory.get((fmt, counts))
+        if image is None:
+            image = self._lookup_disk(fmt, counts)
+        return image
+
+    def _lookup_disk(self, fmt: str, counts: tuple) -> Optional[bytes]:
+        key = (fmt, counts)
+        image = self._read_disk(key)
+        if image is not None:
+            self._count("disk_hits")
+            self.memory.set(key, image)
+        return image
+
+    def store(self, fmt: str, counts: tuple, image: bytes):
+        key = (fmt, counts)
+        self._write_disk(key, image)
+        self.memory.set(key, image)
+
+    def _render(self, fmt: str, counts: tuple) -> bytes:
+        image = self._lookup_disk(fmt, counts)
+        if image is None:
+            image = chart_renderer.submit(fmt, counts).result()
+        return image
+
+    def get_or_render(self, fmt: str, counts: tuple) -> bytes:
+        image = self.memory.get((fmt, counts))
+        if image is None:
+            image = self._render(fmt, counts)
+        return image
+
+    async def get_or_render_async(self, fmt: str, counts: tuple) -> bytes:
+        image = self.memory.get((fmt, counts))
+        if image is not None:
+            return image
+        if not chart_renderer.uses_pool(fmt):
+            # SVG рисуется в вызывающем потоке и сразу пишется в файл кэша —
+            # вместе с чтением с диска это уходит из event loop
+            return await asyncio.to_thread(self._render, fmt, counts)
+        image = await asyncio.to_thread(self._lookup_disk, fmt, counts)
+        if image is None:
+            image = await asyncio.wrap_future(chart_renderer.submit(fmt, counts))
+        return image
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["memory"] = self.memory.stats()
+        return stats
+
+
+class ChartRenderQueueFull(RuntimeError):
+    pass
+
+
+class ChartRenderer:
+    """Отрисовка графиков вне event loop.
+
+    PNG рисуется matplotlib, который не потокобезопасен, поэтому он уходит
+    в ограниченный пул процессов. Одинаковые одновременные запросы
+    объединяются и ждут одну и ту же задачу. SVG дешевый и рисуется сразу.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = None
+        self._inflight: Dict[tuple, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {
+            "submitted": 0,
+            "coalesced": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "pool_restarts": 0,
+            "max_queue_depth": 0,
+            "render_ms_total": 0.0,
+            "latency_ms_total": 0.0,
+        }
+
+    def uses_pool(self, fmt: str) -> bool:
+        return fmt == "png" and self.workers > 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # spawn: fork процесса с потоками uvicorn может унаследовать захваченные блокировки
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def _reset_executor(self, executor: ProcessPoolExecutor):
+        """Пул с упавшим процессом больше не принимает задачи — следующая получит новый"""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.stats["pool_restarts"] += 1
+        print("Пул отрисовки графиков сломан, будет создан заново")
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _submit_to_pool(self, fmt: str, counts: tuple) -> Future:
+        executor = self._get_executor()
+        try:
+            job = executor.submit(charts.render_timed, fmt, counts)
+        except BrokenProcessPool:
+            self._reset_executor(executor)
+            job = self._get_executor().submit(charts.render_timed, fmt, counts)
+
+        def check_broken(done: Future):
+            if not done.cancelled() and isinstance(done.exception(), BrokenProcessPool):
+                self._reset_executor(executor)
+
+        job.add_done_callback(check_broken)
+        return job
+
+    def submit(self, fmt: str, counts: tuple) -> Future:
+        key = (fmt, counts)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                return future
+
+            if len(self._inflight) >= self.max_pending:
+                self.stats["rejected"] += 1
+                raise ChartRenderQueueFull("Too many charts are being rendered")
+
+            future = Future()
+            self._inflight[key] = future
+            self.stats["submitted"] += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], len(self._inflight))
+            started = time.perf_counter()
+
+        def finish(job: Future):
+            try:
+                image, render_ms = job.result()
+                chart_cache.store(fmt, counts, image)
+            except Exception as e:
+                with self._lock:
+                    self.stats["failed"] += 1
+                    self._inflight.pop(key, None)
+                future.set_exception(e)
+                return
+
+            with self._lock:
+                self.stats["completed"] += 1
+                self.stats["render_ms_total"] += render_ms
+                self.stats["latency_ms_total"] += (time.perf_counter() - started) * 1000
+                self._inflight.pop(key, None)
+            future.set_result(image)
+
+        if self.uses_pool(fmt):
+            try:
+                job = self._submit_to_pool(fmt, counts)
+            except Exception as e:
+                job = Future()
+                job.set_exception(e)
+        else:
+            job = Future()
+            try:
+                job.set_result(charts.render_timed(fmt, counts))
+            except Exception as e:
+                job.set_exception(e)
+        job.add_done_callback(finish)
+        return future
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["queue_depth"] = len(self._inflight)
+        stats["workers"] = self.workers
+        done = stats["completed"]
+        stats["avg_render_ms"] = round(stats["render_ms_total"] / done, 2) if done else 0.0
+        stats["avg_latency_ms"] = round(stats["latency_ms_total"] / done, 2) if done else 0.0
+        return stats
+
+
+chart_cache = ChartCache(CHART_CACHE_SIZE, CHART_CACHE_DIR)
+chart_renderer = ChartRenderer(CHART_RENDER_WORKERS, CHART_RENDER_MAX_PENDING)
+
+
 class ResultsService:
     @staticmethod
-    def generate_results_chart(results_data: dict) -> str:
-        plt.style.use('default')
-        fig, ax = plt.subplots(figsize=(10, 6))
+    def chart_key(results_data: dict) -> tuple:
+        return tuple(int(results_data.get(t, 0) or 0) for t in RESULT_TYPES)
 
-        types = ['A', 'B', 'C', 'D']
-        counts = [results_data.get('A', 0), results_data.get('B', 0),
-                  results_data.get('C', 0), results_data.get('D', 0)]
-        colors = ['#FF6B6B', '#4ECDC4', '#45B7D1', '#96CEB4']
+    @staticmethod
+    def chart_format() -> str:
+        # без matplotlib PNG недоступен, тогда остается SVG
+        if CHART_FORMAT not in charts.RENDERERS or (CHART_FORMAT == "png" and not charts.png_available()):
+            return "svg"
+        return CHART_FORMAT
 
-        bars = ax.bar(types, counts, color=colors,
-                      edgecolor='black', linewidth=2, alpha=0.8)
+    @staticmethod
+    def get_chart(counts: tuple, fmt: Optional[str] = None) -> bytes:
+        return chart_cache.get_or_render(fmt or ResultsService.chart_format(), counts)
 
-        for bar, count in zip(bars, counts):
-            height = bar.get_height()
-            ax.text(bar.get_x() + bar.get_width()/2., height + 0.1,
-                    f'{count}', ha='center', va='bottom', fontsize=14, fontweight='bold')
+    @staticmethod
+    async def get_chart_async(counts: tuple, fmt: Optional[str] = None) -> bytes:
+        return await chart_cache.get_or_render_async(fmt or ResultsService.chart_format(), counts)
 
-        ax.set_ylabel('Количество ответов', fontsize=12, fontweight='bold')
-        ax.set_xlabel('Типы личности', fontsize=12, fontweight='bold')
-        ax.set_title('Результаты опросника', fontsize=16, fontweight='bold', pad=20)
-        ax.set_ylim(0, max(counts) + 2)
+    @staticmethod
+    def chart_hash(counts: tuple, fmt: str) -> str:
+        raw = f"{CHART_VERSION}:{fmt}:{','.join(map(str, counts))}"
+        return hashlib.sha256(raw.encode()).hexdigest()[:16]
+
+    @staticmethod
+    def chart_url(results_data: dict) -> str:
+        """Неизменяемый адрес графика: счетчики и хэш от них, версии и формата.
 
-        ax.grid(axis='y', alpha=0.3, linestyle='--')
-        ax.set_axisbelow(True)
+        Адрес не зависит от состояния процесса, поэтому его может отдать
+        любой воркер, а браузер — кэшировать навсегда.
+        """
+        fmt = ResultsService.chart_format()
+        counts = ResultsService.chart_key(results_data)
+        name = "-".join(map(str, counts))
+        return f"/results/chart/{name}-{ResultsService.chart_hash(counts, fmt)}.{fmt}"
 
-        for spine in ax.spines.values():
-            spine.set_visible(False)
+    @staticmethod
+    def parse_chart_name(chart_name: str) -> Optional[tuple]:
+        """Разбирает '<A>-<B>-<C>-<D>-<hash>.<fmt>', возвращает (fmt, counts, hash)"""
+        name, _, fmt = chart_name.rpartition(".")
+        parts = name.split("-")
+        if fmt not in charts.RENDERERS or len(parts) != len(RESULT_TYPES) + 1:
+            return None
+        *raw_counts, digest = parts
+        if not all(c.isdigit() for c in raw_counts):
+            return None
 
-        buf = io.BytesIO()
-        plt.savefig(buf, format='png', dpi=100, bbox_inches='tight',
-                    facecolor='white', edgecolor='none')
-        plt.close(fig)
-        buf.seek(0)
+        counts = tuple(int(c) for c in raw_counts)
+        if digest != ResultsService.chart_hash(counts, fmt):
+            return None
+        # адрес публичный, а каждый новый график рисуется и пишется на диск:
+        # принимаются только счетчики, которые может дать опросник
+        if not scoring_engine.is_reachable(counts):
+            return None
+        if fmt == "png" and not charts.png_available():
+            return None
+        return fmt, counts, digest
 
-        image_base64 = base64.b64encode(buf.getvalue()).decode('utf-8')
-        return f"data:image/png;base64,{image_base64}"
+    @staticmethod
+    def warm_chart_cache() -> int:
+        """Отрисовать заранее графики для всех достижимых результатов опросника"""
+        fmt = ResultsService.chart_format()
+        keys = scoring_engine.reachable_scores()
+        failed = 0
+        for key in keys:
+            delay = 0.1
+            while True:
+                try:
+                    chart_cache.get_or_render(fmt, key)
+                    break
+                except ChartRenderQueueFull:
+                    # очередь занята запросами пользователей: прогрев подождет
+                    time.sleep(delay)
+                    delay = min(delay * 2, 5.0)
+                except Exception as e:
+                    failed += 1
+                    print(f"Не удалось отрисовать график {key}: {e}")
+                    break
+        print(f"Кэш графиков прогрет: {len(keys) - failed} вариантов из {len(keys)}")
+        return len(keys) - failed
+
+    @staticmethod
+    def prepare_chart_names():
+        """Заранее строит множество допустимых счетчиков для parse_chart_name,
+        чтобы первый запрос графика не считал его в event loop"""
+        thread = threading.Thread(target=scoring_engine.reachable_set, name="chart-names", daemon=True)
+        thread.start()
+
+    @staticmethod
+    def start_chart_warmup():
+        thread = threading.Thread(target=ResultsService.warm_chart_cache, name="chart-warmup", daemon=True)
+        thread.start()
+
+    @staticmethod
+    def get_chart_cache_stats() -> dict:
+        stats = chart_cache.get_stats()
+        stats["renderer"] = chart_renderer.get_stats()
+        return stats
+
+    @staticmethod
+    def shutdown():
+        chart_renderer.shutdown()
 
     @staticmethod
     def get_user_results(user_id: int):
         result = QuizRepository.get_latest_results(user_id)
-        if result and result[1]:
-            results_data = eval(result[1])
-            chart_image = ResultsService.generate_results_chart(results_data)
+        results_data = decode_results(result[1]) if result else None
+        if results_data:
             return {
                 "results": results_data,
-                "image": chart_image
+                "image_url": ResultsService.chart_url(results_data)
             }
-        return None
\ No newline at end of file
+        return None
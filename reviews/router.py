@@ -1,14 +1,14 @@
-from fastapi import APIRouter, Request, Depends, HTTPException
+import asyncio
+from fastapi import APIRouter, Request, Depends, HTTPException, Query
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel
 from typing import Optional, List
-import math
-from datetime import datetime, timedelta
 
 from auth.dependencies import get_current_user
-from database.repositories import ReviewRepository
-from config import TEMPLATES_DIR, STATIC_DIR
+from reviews.service import ReviewService
+from database.serialization import encode_cursor, decode_cursor
+from config import TEMPLATES_DIR, STATIC_DIR, REVIEWS_PAGE_SIZE, REVIEWS_PAGE_MAX
 from fastapi.staticfiles import StaticFiles
 
 router = APIRouter(tags=["reviews"])
@@ -33,33 +33,30 @@ def reviews_page(
 async def get_reviews(
     request: Request,
     sort: str = "newest",
+    cursor: Optional[str] = None,
+    limit: int = Query(REVIEWS_PAGE_SIZE, ge=1, le=REVIEWS_PAGE_MAX),
     user_id: int = Depends(get_current_user)
 ):
+    """Лента отзывов страницами; следующая страница — с cursor=next_cursor"""
+    try:
+        after = decode_cursor(cursor) if cursor else None
+        # чтение ждёт идущего сброса лайков, а он держит блокировки на время транзакции
+        feed = await asyncio.to_thread(ReviewService.get_feed, user_id, sort, after, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
     try:
-        reviews = ReviewRepository.get_all_reviews(sort)
-        average_rating = ReviewRepository.get_average_rating()
-        reviews_count = ReviewRepository.get_reviews_count()
-        
-        
-        for review in reviews:
-            review['time_ago'] = format_time_ago(review['created_at'])
-            
-            
-            review['user_has_liked'] = ReviewRepository.has_user_liked(
-                review['id'], user_id
-            )
-        
-        
-        user_review = ReviewRepository.get_review_by_user(user_id)
-        if user_review:
-            user_review['time_ago'] = format_time_ago(user_review['created_at'])
-        
         return {
             'success': True,
-            'reviews': reviews,
-            'average_rating': average_rating,
-            'reviews_count': reviews_count,
-            'user_review': user_review
+            'reviews': feed['reviews'],
+            'average_rating': feed['average_rating'],
+            'reviews_count': feed['reviews_count'],
+            'rating_distribution': feed['rating_distribution'],
+            'user_review': feed['user_review'],
+            'has_more': feed['next_cursor'] is not None,
+            'next_cursor': encode_cursor(feed['next_cursor']) if feed['next_cursor'] else None
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -72,14 +69,14 @@ async def create_review(
 ):
     try:
         
-        existing_review = ReviewRepository.get_review_by_user(user_id)
+        existing_review = ReviewService.get_review_by_user(user_id)
         if existing_review:
             raise HTTPException(status_code=400, detail="Вы уже оставили отзыв")
         
         if not 1 <= review_data.rating <= 5:
             raise HTTPException(status_code=400, detail="Рейтинг должен быть от 1 до 5")
         
-        success = ReviewRepository.create_review(
+        success = ReviewService.create_review(
             user_id, 
             review_data.rating, 
             review_data.comment
@@ -102,7 +99,7 @@ async def like_review(
     user_id: int = Depends(get_current_user)
 ):
     try:
-        success = ReviewRepository.like_review(review_id, user_id)
+        success = await asyncio.to_thread(ReviewService.like_review, review_id, user_id)
         return {"success": success}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -114,7 +111,7 @@ async def unlike_review(
     user_id: int = Depends(get_current_user)
 ):
     try:
-        success = ReviewRepository.unlike_review(review_id, user_id)
+        success = await asyncio.to_thread(ReviewService.unlike_review, review_id, user_id)
         return {"success": success}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -125,7 +122,7 @@ async def delete_user_review(
     user_id: int = Depends(get_current_user)
 ):
     try:
-        success = ReviewRepository.delete_review(user_id)
+        success = ReviewService.delete_review(user_id)
         if not success:
             raise HTTPException(status_code=404, detail="Отзыв не найден")
         return {"success": True}
@@ -133,37 +130,3 @@ async def delete_user_review(
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
-
-def format_time_ago(timestamp):
-    """Форматирование времени в человекочитаемый вид с учетом локального времени"""
-    if isinstance(timestamp, str):
-        
-        if 'Z' in timestamp:
-            timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
-            
-            timestamp = timestamp.astimezone()
-        else:
-            timestamp = datetime.fromisoformat(timestamp)
-    
-    
-    if timestamp.tzinfo is None:
-        timestamp = timestamp.replace(tzinfo=None)
-        now = datetime.now()
-    else:
-        now = datetime.now().astimezone()
-    
-    diff = now - timestamp
-    
-    if diff < timedelta(minutes=1):
-        return "только что"
-    elif diff < timedelta(hours=1):
-        minutes = math.floor(diff.seconds / 60)
-        return f"{minutes} минут назад"
-    elif diff < timedelta(days=1):
-        hours = math.floor(diff.seconds / 3600)
-        return f"{hours} часов назад"
-    elif diff < timedelta(days=30):
-        days = diff.days
-        return f"{days} дней назад"
-    else:
-        return timestamp.strftime("%d.%m.%Y в %H:%M")
\ No newline at end of file
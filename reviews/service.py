@@ -0,0 +1,513 @@
+import math
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Set
+from cache import TTLCache
+from database.repositories import ReviewRepository
+from config import (
+    LIKE_FLUSH_INTERVAL,
+    LIKE_RECONCILE_INTERVAL,
+    REVIEW_FEED_CACHE_PAGES,
+    REVIEW_FEED_CACHE_TTL,
+    REVIEW_FEED_CACHE_USERS,
+    REVIEW_TIME_AGO_REFRESH,
+)
+
+# сколько раз get_feed перечитывает ленту, если её чтение пересеклось со сбросом лайков
+FEED_READ_ATTEMPTS = 3
+
+
+def format_time_ago(timestamp):
+    """Форматирование времени в человекочитаемый вид с учетом локального времени"""
+    if isinstance(timestamp, str):
+
+        if 'Z' in timestamp:
+            timestamp = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+
+            timestamp = timestamp.astimezone()
+        else:
+            timestamp = datetime.fromisoformat(timestamp)
+
+
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=None)
+        now = datetime.now()
+    else:
+        now = datetime.now().astimezone()
+
+    diff = now - timestamp
+
+    if diff < timedelta(minutes=1):
+        return "только что"
+    elif diff < timedelta(hours=1):
+        minutes = math.floor(diff.seconds / 60)
+        return f"{minutes} минут назад"
+    elif diff < timedelta(days=1):
+        hours = math.floor(diff.seconds / 3600)
+        return f"{hours} часов назад"
+    elif diff < timedelta(days=30):
+        days = diff.days
+        return f"{days} дней назад"
+    else:
+        return timestamp.strftime("%d.%m.%Y в %H:%M")
+
+
+class _UserState:
+    __slots__ = ("liked", "review", "version")
+
+    def __init__(self, liked: Set[int]):
+        # id лайкнутых пользователем отзывов; обновляется при like/unlike
+        self.liked = liked
+        self.review = None
+        # версия ленты, при которой прочитан отзыв пользователя; None — не прочитан
+        self.version = None
+
+
+class ReviewFeedCache:
+    """Кэш ленты отзывов в памяти процесса.
+
+    Страница ленты (отзывы по сортировке и курсору плюс статистика) одинакова для всех
+    пользователей, поэтому хранится одна на процесс вместе с готовыми строками
+    «N минут назад», которые пересчитываются раз в time_refresh секунд. Любое изменение
+    отзывов или лайков сбрасывает страницы. Флаги user_has_liked накладываются из
+    небольшого множества лайков каждого пользователя, которое поддерживается при like/unlike.
+    Кэш локален для процесса: изменения, сделанные другим процессом, видны после
+    истечения ttl. Если like/unlike не удался, множество пользователя считается
+    устаревшим и перечитывается.
+    """
+
+    def __init__(self, max_pages: int, max_users: int, time_refresh: float, ttl: Optional[float] = None):
+        self.pages = TTLCache(max(max_pages, 1), ttl)
+        self.users = TTLCache(max(max_users, 1), ttl)
+        self.enabled = max_pages > 0
+        self.time_refresh = time_refresh
+        # версия растёт при каждом изменении; страница, прочитанная до изменения, не кэшируется
+        self._version = 0
+        self._lock = threading.Lock()
+        # user_id -> [число идущих загрузок, изменения лайков за время загрузки]
+        self._loading: Dict[int, list] = {}
+        self.stats = {"invalidations": 0, "page_reads": 0, "user_reads": 0}
+
+    def _clock(self) -> int:
+        if self.time_refresh <= 0:
+            return time.monotonic_ns()
+        return int(time.monotonic() // self.time_refresh)
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _with_time_ago(self, entry: dict, clock: int) -> dict:
+        return {
+            **entry,
+            "reviews": [
+                {**review, "time_ago": format_time_ago(review["created_at"])}
+                for review in entry["reviews"]
+            ],
+            "clock": clock,
+        }
+
+    def _store_page(self, key: tuple, entry: dict):
+        with self._lock:
+            if entry["version"] == self._version:
+                self.pages.set(key, entry)
+
+    def get_page(self, sort_by: str, after: Optional[list], limit: int) -> dict:
+        key = (sort_by, tuple(after) if after is not None else None, limit)
+        clock = self._clock()
+        entry = self.pages.get(key)
+        if entry is None:
+            version = self._version
+            self._count("page_reads")
+            page = ReviewRepository.get_reviews_page(sort_by, after, limit)
+            entry = self._with_time_ago({**page, "version": version}, clock)
+            self._store_page(key, entry)
+        elif entry["clock"] != clock:
+            # закэшированные записи не меняются на месте: их могут читать параллельные запросы
+            entry = self._with_time_ago(entry, clock)
+            self._store_page(key, entry)
+        return entry
+
+    def _user(self, user_id: int) -> _UserState:
+        state = self.users.get(user_id)
+        if state is not None:
+            return state
+
+        # SELECT идет без блокировки; лайки, записанные во время него, копятся
+        # в _loading и накладываются на прочитанное множество
+        with self._lock:
+            self.stats["user_reads"] += 1
+            loading = self._loading.setdefault(user_id, [0, []])
+            loading[0] += 1
+        try:
+            liked = ReviewRepository.get_liked_review_ids(user_id)
+        finally:
+            with self._lock:
+                loading[0] -= 1
+                if not loading[0]:
+                    self._loading.pop(user_id, None)
+
+        with self._lock:
+            state = self.users.peek(user_id)
+            if state is None:
+                for review_id, is_liked in loading[1]:
+                    if is_liked:
+                        liked.add(review_id)
+                    else:
+                        liked.discard(review_id)
+                state = _UserState(liked)
+                self.users.set(user_id, state)
+            return state
+
+    def get_liked(self, user_id: int) -> Set[int]:
+        return self._user(user_id).liked
+
+    def get_user_review(self, user_id: int) -> Optional[dict]:
+        state = self._user(user_id)
+        version = self._version
+        if state.version != version:
+            self._count("user_reads")
+            state.review = ReviewRepository.get_review_by_user(user_id)
+            state.version = version
+        return state.review
+
+    def invalidate(self):
+        with self._lock:
+            self._version += 1
+            self.stats["invalidations"] += 1
+        self.pages.clear()
+
+    def set_liked(self, user_id: int, review_id: int, liked: bool):
+        with self._lock:
+            state = self.users.peek(user_id)
+            if state is not None:
+                if liked:
+                    state.liked.add(review_id)
+                else:
+                    state.liked.discard(review_id)
+            loading = self._loading.get(user_id)
+            if loading is not None:
+                loading[1].append((review_id, liked))
+
+    def forget_user(self, user_id: int):
+        """Сбросить лайки пользователя: множество разошлось с базой
+        (например, лайк поставлен через другой воркер)"""
+        self.users.delete(user_id)
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+        stats["enabled"] = self.enabled
+        stats["pages"] = self.pages.stats()
+        stats["users"] = self.users.stats()
+        stats["time_refresh"] = self.time_refresh
+        return stats
+
+
+feed_cache = ReviewFeedCache(
+    REVIEW_FEED_CACHE_PAGES,
+    REVIEW_FEED_CACHE_USERS,
+    REVIEW_TIME_AGO_REFRESH,
+    REVIEW_FEED_CACHE_TTL,
+)
+
+
+class LikeCounterBuffer:
+    """Пакетное обновление счётчиков лайков.
+
+    Строки review_likes пишутся сразу и остаются источником истины, а изменения
+    reviews.likes и review_stats.total_likes копятся в памяти и сбрасываются одной
+    транзакцией раз в flush_interval секунд, а не UPDATE горячей строки на каждый клик.
+    При чтении к счётчикам из базы прибавляются ещё не сброшенные дельты.
+    Раз в reconcile_interval секунд счётчики сверяются с review_likes.
+
+    Буфер локален для процесса, а сверка знает только его дельты, поэтому он
+    рассчитан на одного воркера (см. WEB_CONCURRENCY в config.py).
+    """
+
+    def __init__(self, flush_interval: float, reconcile_interval: float):
+        self.flush_interval = flush_interval
+        self.reconcile_interval = reconcile_interval
+        self._pending: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        # удерживается на время записи лайка, сброса и сверки: запись в review_likes
+        # и её дельта появляются вместе, поэтому сверка не посчитает один лайк дважды
+        self._write_lock = threading.Lock()
+        # номер состояния для читателей: нечётный, пока идёт сброс. Во время сброса
+        # счётчик в базе и дельта в памяти могут разойтись, так что чтение, заставшее
+        # сброс, повторяется (см. ReviewService.get_feed)
+        self._seq = 0
+        self._idle = threading.Event()
+        self._idle.set()
+        self._stop = threading.Event()
+        self._thread = None
+        self._next_reconcile = None
+        self.stats = {
+            "buffered": 0, "flushes": 0, "flushed_reviews": 0, "flush_errors": 0,
+            "reconciles": 0, "reconciled_reviews": 0, "reconcile_errors": 0,
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.flush_interval > 0
+
+    def delta(self, review_id: int) -> int:
+        return self._pending.get(review_id, 0)
+
+    def snapshot(self) -> int:
+        """Ждёт окончания идущего сброса и возвращает номер состояния"""
+        while True:
+            self._idle.wait()
+            seq = self._seq
+            if seq % 2 == 0:
+                return seq
+
+    def changed(self, seq: int) -> bool:
+        return self._seq != seq
+
+    def like(self, review_id: int, user_id: int) -> bool:
+        with self._write_lock:
+            success = ReviewRepository.like_review(review_id, user_id, update_counter=False)
+            if success:
+                self._add(review_id, 1)
+            return success
+
+    def unlike(self, review_id: int, user_id: int) -> bool:
+        with self._write_lock:
+            success = ReviewRepository.unlike_review(review_id, user_id, update_counter=False)
+            if success:
+                self._add(review_id, -1)
+            return success
+
+    def _add(self, review_id: int, delta: int):
+        with self._lock:
+            self._pending[review_id] = self._pending.get(review_id, 0) + delta
+            self.stats["buffered"] += 1
+
+    def _flush(self) -> int:
+        with self._lock:
+            pending = dict(self._pending)
+            if not pending:
+                return 0
+            self._seq += 1
+            self._idle.clear()
+
+        try:
+            ReviewRepository.apply_like_deltas(pending)
+        except Exception as e:
+            print(f"Ошибка сброса счётчиков лайков: {e}")
+            with self._lock:
+                self.stats["flush_errors"] += 1
+            raise
+        else:
+            with self._lock:
+                # пока идёт сброс, новых дельт нет (_write_lock), сброшенные просто убираются
+                for review_id in pending:
+                    self._pending.pop(review_id, None)
+                self.stats["flushes"] += 1
+                self.stats["flushed_reviews"] += len(pending)
+            # до конца сброса: страницы, прочитанные во время него, не переживут его
+            feed_cache.invalidate()
+        finally:
+            with self._lock:
+                self._seq += 1
+                self._idle.set()
+        return len(pending)
+
+    def flush(self) -> int:
+        with self._write_lock:
+            return self._flush()
+
+    def reconcile(self, check_only: bool = False) -> dict:
+        """Пересчитывает reviews.likes и review_stats по review_likes за вычетом
+        ещё не сброшенных дельт"""
+        try:
+            with self._write_lock:
+                with self._lock:
+                    pending = dict(self._pending)
+                report = ReviewRepository.reconcile_like_counts(check_only=check_only, pending=pending)
+        except Exception as e:
+            print(f"Ошибка сверки счётчиков лайков: {e}")
+            with self._lock:
+                self.stats["reconcile_errors"] += 1
+            raise
+        if report["mismatched"]:
+            print(f"Счётчики лайков расходились с review_likes у {len(report['mismatched'])} отзывов")
+        with self._lock:
+            self.stats["reconciles"] += 1
+            self.stats["reconciled_reviews"] += len(report["mismatched"])
+        if not check_only:
+            feed_cache.invalidate()
+        return report
+
+    def rebuild_review_stats(self, check_only: bool = False) -> dict:
+        """Пересчёт review_stats с учётом ещё не сброшенных дельт"""
+        with self._write_lock:
+            with self._lock:
+                pending_likes = sum(self._pending.values())
+            report = ReviewRepository.rebuild_review_stats(check_only=check_only, pending_likes=pending_likes)
+        if not check_only:
+            feed_cache.invalidate()
+        return report
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                if self._next_reconcile is not None and time.monotonic() >= self._next_reconcile:
+                    self._next_reconcile = time.monotonic() + self.reconcile_interval
+                    self.reconcile()
+                else:
+                    self.flush()
+            except Exception:
+                # ошибка уже в логе и в stats; следующая попытка — на следующем тике
+                pass
+
+    def start(self):
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        if self.reconcile_interval > 0:
+            self._next_reconcile = time.monotonic() + self.reconcile_interval
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="review-likes-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            self.flush()
+        except Exception:
+            # остановка приложения не должна прерываться; потерянные дельты исправит сверка
+            print(f"Счётчики лайков не сброшены при остановке: {len(self._pending)} отзывов")
+
+    def get_stats(self) -> dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["pending_reviews"] = len(self._pending)
+            stats["pending_likes"] = sum(self._pending.values())
+        stats["flush_interval"] = self.flush_interval
+        stats["reconcile_interval"] = self.reconcile_interval
+        return stats
+
+
+like_buffer = LikeCounterBuffer(LIKE_FLUSH_INTERVAL, LIKE_RECONCILE_INTERVAL)
+
+
+class ReviewService:
+    @staticmethod
+    def get_feed(user_id: int, sort_by: str, after: Optional[list], limit: int) -> dict:
+        """Лента отзывов для пользователя: общая страница из кэша с его флагами лайков"""
+        for _ in range(FEED_READ_ATTEMPTS):
+            seq = like_buffer.snapshot()
+            feed = ReviewService._read_feed(user_id, sort_by, after, limit)
+            # сброс лайков во время чтения мог учесть дельту дважды или потерять её
+            if not like_buffer.changed(seq):
+                return feed
+        # сбросы идут один за другим: счётчики могут быть неточны на один сброс
+        return feed
+
+    @staticmethod
+    def _read_feed(user_id: int, sort_by: str, after: Optional[list], limit: int) -> dict:
+        if not feed_cache.enabled:
+            feed = ReviewRepository.get_reviews_feed(user_id, sort_by, after, limit)
+            for review in feed["reviews"]:
+                review["time_ago"] = format_time_ago(review["created_at"])
+                review["likes"] += like_buffer.delta(review["id"])
+        else:
+            page = feed_cache.get_page(sort_by, after, limit)
+            liked = feed_cache.get_liked(user_id)
+            feed = {k: v for k, v in page.items() if k not in ("clock", "version")}
+            feed["reviews"] = [
+                {
+                    **review,
+                    "likes": review["likes"] + like_buffer.delta(review["id"]),
+                    "user_has_liked": review["id"] in liked,
+                }
+                for review in page["reviews"]
+            ]
+            feed["user_review"] = feed_cache.get_user_review(user_id)
+
+        user_review = feed["user_review"]
+        if user_review:
+            feed["user_review"] = {
+                **user_review,
+                "likes": user_review["likes"] + like_buffer.delta(user_review["id"]),
+                "time_ago": format_time_ago(user_review["created_at"]),
+            }
+        return feed
+
+    @staticmethod
+    def get_review_by_user(user_id: int) -> Optional[dict]:
+        return ReviewRepository.get_review_by_user(user_id)
+
+    @staticmethod
+    def create_review(user_id: int, rating: int, comment: str) -> bool:
+        success = ReviewRepository.create_review(user_id, rating, comment)
+        if success:
+            feed_cache.invalidate()
+        return success
+
+    @staticmethod
+    def update_review(user_id: int, rating: int, comment: str) -> bool:
+        success = ReviewRepository.update_review(user_id, rating, comment)
+        if success:
+            feed_cache.invalidate()
+        return success
+
+    @staticmethod
+    def delete_review(user_id: int) -> bool:
+        success = ReviewRepository.delete_review(user_id)
+        if success:
+            # id отзывов не переиспользуются (AUTOINCREMENT), так что его лайки
+            # в множествах пользователей просто больше не встретятся в ленте
+            feed_cache.invalidate()
+        return success
+
+    @staticmethod
+    def like_review(review_id: int, user_id: int) -> bool:
+        if like_buffer.enabled:
+            # страницы ленты не сбрасываются: счётчик догоняется дельтой при чтении
+            success = like_buffer.like(review_id, user_id)
+        else:
+            success = ReviewRepository.like_review(review_id, user_id)
+        if success:
+            feed_cache.set_liked(user_id, review_id, True)
+            if not like_buffer.enabled:
+                feed_cache.invalidate()
+        else:
+            # лайк уже стоит, хотя кэш мог показать обратное — следующее чтение возьмет его из базы
+            feed_cache.forget_user(user_id)
+        return success
+
+    @staticmethod
+    def unlike_review(review_id: int, user_id: int) -> bool:
+        if like_buffer.enabled:
+            success = like_buffer.unlike(review_id, user_id)
+        else:
+            success = ReviewRepository.unlike_review(review_id, user_id)
+        if success:
+            feed_cache.set_liked(user_id, review_id, False)
+            if not like_buffer.enabled:
+                feed_cache.invalidate()
+        else:
+            feed_cache.forget_user(user_id)
+        return success
+
+    @staticmethod
+    def reconcile_likes(check_only: bool = False) -> dict:
+        return like_buffer.reconcile(check_only=check_only)
+
+    @staticmethod
+    def rebuild_review_stats(check_only: bool = False) -> dict:
+        return like_buffer.rebuild_review_stats(check_only=check_only)
+
+    @staticmethod
+    def get_like_buffer_stats() -> dict:
+        return like_buffer.get_stats()
+
+    @staticmethod
+    def get_cache_stats() -> dict:
+        return feed_cache.get_stats()
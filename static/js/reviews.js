@@ -3,6 +3,9 @@ class ReviewsManager {
     this.userId = new URLSearchParams(window.location.search).get("user_id");
     this.currentSort = "newest";
     this.selectedRating = 0;
+    // Курсор следующей страницы ленты; null — страниц больше нет
+    this.nextCursor = null;
+    this.loadingMore = false;
     this.init();
   }
 
@@ -49,6 +52,16 @@ class ReviewsManager {
         this.handleFilterClick(e.target);
       });
     });
+
+    // Подгрузка следующей страницы при прокрутке к концу списка
+    window.addEventListener("scroll", () => {
+      if (
+        window.innerHeight + window.scrollY >=
+        document.documentElement.scrollHeight - 300
+      ) {
+        this.loadMoreReviews();
+      }
+    });
   }
 
   async loadReviews() {
@@ -62,6 +75,7 @@ class ReviewsManager {
         this.updateStats(data);
         this.updateUserReview(data.user_review);
         this.renderReviews(data.reviews);
+        this.nextCursor = data.next_cursor;
       } else {
         this.showError("Ошибка загрузки отзывов");
       }
@@ -71,6 +85,30 @@ class ReviewsManager {
     }
   }
 
+  async loadMoreReviews() {
+    if (!this.nextCursor || this.loadingMore) return;
+    this.loadingMore = true;
+    const sort = this.currentSort;
+    try {
+      const response = await fetch(
+        `/api/reviews?sort=${sort}&cursor=${encodeURIComponent(
+          this.nextCursor
+        )}&user_id=${this.userId}`
+      );
+      const data = await response.json();
+
+      // пока страница грузилась, пользователь мог сменить сортировку
+      if (data.success && sort === this.currentSort) {
+        this.renderReviews(data.reviews, true);
+        this.nextCursor = data.next_cursor;
+      }
+    } catch (error) {
+      console.error("Error loading more reviews:", error);
+    } finally {
+      this.loadingMore = false;
+    }
+  }
+
   updateStats(data) {
     // Обновляем статистику
     document.querySelector(".rating-number").textContent = data.average_rating;
@@ -79,6 +117,15 @@ class ReviewsManager {
     // Обновляем звезды среднего рейтинга
     const starsElement = document.querySelector(".rating-stars .stars");
     starsElement.innerHTML = this.generateStars(data.average_rating, false);
+
+    // Распределение оценок
+    const distribution = data.rating_distribution || {};
+    document.querySelectorAll(".distribution-row").forEach((row) => {
+      const count = distribution[row.dataset.rating] || 0;
+      const percent = data.reviews_count ? (count / data.reviews_count) * 100 : 0;
+      row.querySelector(".distribution-fill").style.width = `${percent}%`;
+      row.querySelector(".distribution-count").textContent = count;
+    });
   }
 
   updateUserReview(userReview) {
@@ -107,16 +154,18 @@ class ReviewsManager {
     }
   }
 
-  renderReviews(reviews) {
+  renderReviews(reviews, append = false) {
     const container = document.getElementById("reviewsList");
 
     if (reviews.length === 0) {
-      container.innerHTML =
-        '<div class="no-reviews">Пока нет отзывов. Будьте первым!</div>';
+      if (!append) {
+        container.innerHTML =
+          '<div class="no-reviews">Пока нет отзывов. Будьте первым!</div>';
+      }
       return;
     }
 
-    container.innerHTML = reviews
+    const html = reviews
       .map(
         (review) => `
             <div class="review-item" data-review-id="${review.id}">
@@ -159,6 +208,12 @@ class ReviewsManager {
         `
       )
       .join("");
+
+    if (append) {
+      container.insertAdjacentHTML("beforeend", html);
+    } else {
+      container.innerHTML = html;
+    }
   }
 
   generateStars(rating, isActive) {
@@ -363,6 +418,7 @@ class ReviewsManager {
 
     // Устанавливаем новую сортировку и перезагружаем
     this.currentSort = button.dataset.sort;
+    this.nextCursor = null;
     this.loadReviews();
   }
 
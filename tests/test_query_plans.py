@@ -0,0 +1,138 @@
+"""EXPLAIN QUERY PLAN частых запросов: после миграций они идут по индексам idx_*,
+без полного просмотра таблиц и сортировки во временном B-дереве.
+
+Планы снимаются с запросов, которые выполняют сами методы репозиториев,
+поэтому тест следит за SQL в database/repositories.py, а не за его копией.
+"""
+import sqlite3
+from contextlib import nullcontext
+
+import pytest
+
+import database.repositories as repositories
+from database.migrations import apply_migrations
+from database.repositories import (
+    REVIEW_SORTS,
+    ChatRepository,
+    QuizRepository,
+    ReviewRepository,
+    SessionRepository,
+)
+
+
+class ExplainCursor:
+    """Курсор, который перед каждым запросом запоминает его план"""
+
+    def __init__(self, cursor: sqlite3.Cursor, plans: list):
+        self._cursor = cursor
+        self._plans = plans
+
+    def execute(self, sql: str, params=()):
+        plan = self._cursor.connection.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        self._plans.append([row[3] for row in plan])
+        return self._cursor.execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class ExplainConnection:
+    def __init__(self, conn: sqlite3.Connection):
+        self._conn = conn
+        self.plans = []
+
+    def cursor(self) -> ExplainCursor:
+        return ExplainCursor(self._conn.cursor(), self.plans)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+@pytest.fixture
+def explain(tmp_path, monkeypatch):
+    """explain(метод, *аргументы) — планы всех запросов, выполненных методом"""
+    conn = sqlite3.connect(tmp_path / "plans.db")
+    apply_migrations(conn)
+
+    def run(method, *args):
+        proxy = ExplainConnection(conn)
+        monkeypatch.setattr(repositories, "get_db_connection", lambda: nullcontext(proxy))
+        method(*args)
+        return proxy.plans
+
+    yield run
+    conn.close()
+
+
+def assert_uses_index(plans: list, table: str, index: str):
+    details = [detail for plan in plans for detail in plan]
+    assert any(
+        detail.split()[1] == table and f"INDEX {index}" in detail
+        for detail in details if detail.startswith(("SEARCH", "SCAN"))
+    ), details
+    for detail in details:
+        # SCAN без индекса — полный просмотр таблицы
+        assert not (detail.startswith("SCAN") and "INDEX" not in detail), details
+        assert "TEMP B-TREE" not in detail, details
+
+
+HOT_QUERIES = [
+    (SessionRepository.verify_access, (1, "127.0.0.1"), "user_sessions", "idx_user_sessions_user_ip"),
+    (SessionRepository.create_session, (1, "127.0.0.1"), "user_sessions", "idx_user_sessions_ip"),
+    (QuizRepository.get_latest_results, (1,), "user_answers", "idx_user_answers_user_completed"),
+    (ChatRepository.get_user_chats, (1,), "user_chats", "idx_user_chats_user_updated"),
+    (
+        ChatRepository.get_user_chats, (1, ["2024-01-01 00:00:00", 10], 20),
+        "user_chats", "idx_user_chats_user_updated",
+    ),
+    (ChatRepository.get_messages, (1,), "chat_messages", "idx_chat_messages_chat_id"),
+    (ChatRepository.get_recent_messages, (1, 20), "chat_messages", "idx_chat_messages_chat_id"),
+    (ChatRepository.get_messages_page, (1, 100, 20), "chat_messages", "idx_chat_messages_chat_id"),
+    (ChatRepository.get_messages_between, (1, 10, 100, 20), "chat_messages", "idx_chat_messages_chat_id"),
+    (ChatRepository.get_last_message_id, (1,), "chat_messages", "idx_chat_messages_chat_id"),
+    (ReviewRepository.get_liked_review_ids, (1,), "review_likes", "idx_review_likes_user"),
+]
+
+
+@pytest.mark.parametrize(
+    "method, args, table, index", HOT_QUERIES,
+    ids=[f"{method.__qualname__}-{len(args)}" for method, args, *_ in HOT_QUERIES],
+)
+def test_hot_query_uses_index(explain, method, args, table, index):
+    assert_uses_index(explain(method, *args), table, index)
+
+
+def test_unused_chat_messages_index_dropped(tmp_path):
+    conn = sqlite3.connect(tmp_path / "plans.db")
+    apply_migrations(conn)
+    indexes = {
+        row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'chat_messages'"
+        )
+    }
+    conn.close()
+    assert "idx_chat_messages_chat_id" in indexes
+    assert "idx_chat_messages_chat_created" not in indexes
+
+
+REVIEW_FEED_INDEXES = {
+    "newest": "idx_reviews_created",
+    "oldest": "idx_reviews_created",
+    "highest": "idx_reviews_rating_created",
+    "lowest": "idx_reviews_rating_created_desc",
+    "popular": "idx_reviews_likes_created",
+}
+
+
+@pytest.mark.parametrize("sort_by", sorted(REVIEW_SORTS))
+@pytest.mark.parametrize("with_cursor", [False, True])
+def test_review_feed_uses_index(explain, sort_by, with_cursor):
+    after = None
+    if with_cursor:
+        sample = {"created_at": "2024-01-01 00:00:00", "id": 10, "rating": 3, "likes": 5}
+        after = [sample[field] for field in REVIEW_SORTS[sort_by][2]]
+    for plans in (
+        explain(ReviewRepository.get_reviews_page, sort_by, after, 20),
+        explain(ReviewRepository.get_reviews_feed, 1, sort_by, after, 20),
+    ):
+        assert_uses_index(plans, "r", REVIEW_FEED_INDEXES[sort_by])